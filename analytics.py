@@ -0,0 +1,219 @@
+"""Dial-in analyse pr. bønne.
+
+- `recommend` vurderer ét shot; `recommend_kinds`/`recommend_batch` gør det
+  samme vektoriseret for en hel historik (samme grænser)
+- `BeanStats` holder løbende aggregater (antal, hit rate, rullende
+  gennemsnit og mindste kvadraters tendens for kværn→tid og kværn→ratio).
+  Den bygges én gang vektoriseret fra historikken og opdateres derefter i
+  O(1) for hvert nyt shot, så den er lige hurtig med 10 og 10.000 shots.
+
+numpy importeres først når der faktisk analyseres. Modulet importerer ikke
+streamlit.
+"""
+import collections
+import math
+
+RATIO_WINDOW = (1.8, 2.2)
+TIME_WINDOW = (25.0, 30.0)
+TARGET_TIME = sum(TIME_WINDOW) / 2
+ROLLING = 5  # antal shots i de rullende gennemsnit
+
+ADVICE = {
+    "good": "✅ God ekstraktion – behold indstillingerne.",
+    "under": "Underekstraheret → Mal finere (lavere tal) og/eller stop ved {out} g.",
+    "over": "Overekstraheret → Mal grovere (højere tal). Hold dig til {out} g.",
+    "neutral": "Juster småt: sigt efter 25–30 sek og {out} g.",
+}
+
+
+def rec_dose(shot_type: str):
+    return 9.0 if shot_type == "Single" else 18.0 if shot_type == "Double" else None
+
+
+def _known(x) -> bool:
+    return x is not None and x == x
+
+
+def recommend(ratio, time_sec, target_out):
+    has_r, has_t = _known(ratio), _known(time_sec)
+    if has_r and has_t and RATIO_WINDOW[0] <= ratio <= RATIO_WINDOW[1] \
+            and TIME_WINDOW[0] <= time_sec <= TIME_WINDOW[1]:
+        kind = "good"
+    elif (has_t and time_sec < TIME_WINDOW[0]) or (has_r and ratio > RATIO_WINDOW[1]):
+        kind = "under"
+    elif (has_t and time_sec > TIME_WINDOW[1]) or (has_r and ratio < RATIO_WINDOW[0]):
+        kind = "over"
+    else:
+        kind = "neutral"
+    return ADVICE[kind].format(out=round(target_out)), kind
+
+
+def recommend_kinds(ratio, time_sec):
+    """Vektoriseret udgave af `recommend`s vurdering: array af
+    "good"/"under"/"over"/"neutral". Manglende værdier er NaN."""
+    import numpy as np
+
+    r = np.asarray(ratio, dtype=np.float64)
+    t = np.asarray(time_sec, dtype=np.float64)
+    with np.errstate(invalid="ignore"):  # NaN-sammenligninger er bare False
+        good = (r >= RATIO_WINDOW[0]) & (r <= RATIO_WINDOW[1]) \
+            & (t >= TIME_WINDOW[0]) & (t <= TIME_WINDOW[1])
+        under = (t < TIME_WINDOW[0]) | (r > RATIO_WINDOW[1])
+        over = (t > TIME_WINDOW[1]) | (r < RATIO_WINDOW[0])
+    return np.select([good, under, over], ["good", "under", "over"], default="neutral")
+
+
+def recommend_batch(ratio, time_sec, target_out):
+    """`recommend` for en hel historik på én gang → (anbefalinger, kinds)."""
+    import numpy as np
+
+    kinds = recommend_kinds(ratio, time_sec)
+    out = np.round(np.nan_to_num(np.asarray(target_out, dtype=np.float64))).astype(np.int64)
+    advice = [ADVICE[k].format(out=o) for k, o in zip(kinds.tolist(), out.tolist())]
+    return advice, kinds
+
+
+class Trend:
+    """Løbende mindste kvadraters linje y = a + b·x (summer, O(1) pr. punkt)."""
+
+    __slots__ = ("n", "sx", "sy", "sxx", "sxy")
+
+    def __init__(self, n=0, sx=0.0, sy=0.0, sxx=0.0, sxy=0.0):
+        self.n, self.sx, self.sy, self.sxx, self.sxy = n, sx, sy, sxx, sxy
+
+    def add(self, x: float, y: float):
+        if not (_known(x) and _known(y)):
+            return
+        self.n += 1
+        self.sx += x
+        self.sy += y
+        self.sxx += x * x
+        self.sxy += x * y
+
+    @classmethod
+    def from_arrays(cls, x, y):
+        import numpy as np
+
+        ok = ~(np.isnan(x) | np.isnan(y))
+        x, y = x[ok], y[ok]
+        return cls(int(ok.sum()), float(x.sum()), float(y.sum()),
+                   float(x @ x), float(x @ y))
+
+    def slope(self):
+        """Hældning b, eller None hvis der ikke er mindst to forskellige x."""
+        var = self.n * self.sxx - self.sx * self.sx
+        if self.n < 2 or var <= 1e-9 * max(1.0, self.sxx):
+            return None
+        return (self.n * self.sxy - self.sx * self.sy) / var
+
+    def intercept(self):
+        b = self.slope()
+        return None if b is None else (self.sy - b * self.sx) / self.n
+
+    def solve(self, y: float):
+        """x hvor linjen rammer `y` (None uden brugbar hældning)."""
+        b = self.slope()
+        if b is None or abs(b) < 1e-9:
+            return None
+        return (y - self.intercept()) / b
+
+
+class BeanStats:
+    """Løbende aggregater for én bønne. `add` er O(1)."""
+
+    def __init__(self):
+        self.shots = 0
+        self.scored = 0  # shots med både ratio og tid
+        self.hits = 0    # ... der ramte 1.8–2.2 og 25–30 sek
+        self.kinds = collections.Counter()
+        self.grind_time = Trend()
+        self.grind_ratio = Trend()
+        self.grind_min = math.inf
+        self.grind_max = -math.inf
+        self.last_grind = math.nan
+        self.recent = collections.deque(maxlen=ROLLING)  # (ratio, tid), ældste først
+
+    def add(self, grind: float, ratio: float, time_sec: float):
+        grind = math.nan if grind is None else grind
+        ratio = math.nan if ratio is None else ratio
+        time_sec = math.nan if time_sec is None else time_sec
+        self.shots += 1
+        kind = recommend(ratio, time_sec, 0)[1]
+        self.kinds[kind] += 1
+        if _known(ratio) and _known(time_sec):
+            self.scored += 1
+            self.hits += kind == "good"
+        self.grind_time.add(grind, time_sec)
+        self.grind_ratio.add(grind, ratio)
+        if _known(grind):
+            self.grind_min = min(self.grind_min, grind)
+            self.grind_max = max(self.grind_max, grind)
+            self.last_grind = grind
+        self.recent.append((ratio, time_sec))
+
+    @classmethod
+    def from_arrays(cls, grind, ratio, time_sec):
+        """Byg aggregaterne vektoriseret fra numpy-arrays, ældste shot først."""
+        import numpy as np
+
+        stats = cls()
+        stats.shots = len(grind)
+        if not stats.shots:
+            return stats
+        kinds = recommend_kinds(ratio, time_sec)
+        names, counts = np.unique(kinds, return_counts=True)
+        stats.kinds.update(dict(zip(names.tolist(), counts.tolist())))
+        scored = ~(np.isnan(ratio) | np.isnan(time_sec))
+        stats.scored = int(scored.sum())
+        stats.hits = int((scored & (kinds == "good")).sum())
+        stats.grind_time = Trend.from_arrays(grind, time_sec)
+        stats.grind_ratio = Trend.from_arrays(grind, ratio)
+        known = grind[~np.isnan(grind)]
+        if len(known):
+            stats.grind_min = float(known.min())
+            stats.grind_max = float(known.max())
+            stats.last_grind = float(known[-1])
+        stats.recent.extend(zip(ratio[-ROLLING:].tolist(), time_sec[-ROLLING:].tolist()))
+        return stats
+
+    @classmethod
+    def from_shots(cls, shots):
+        """Fra en `ShotStore` (der er nyeste først)."""
+        return cls.from_arrays(shots.values("grind")[::-1], shots.values("ratio")[::-1],
+                               shots.values("time")[::-1])
+
+    def hit_rate(self):
+        return self.hits / self.scored if self.scored else None
+
+    def rolling(self):
+        """Gennemsnitlig (ratio, tid) over de seneste `ROLLING` shots."""
+        out = []
+        for i in (0, 1):
+            xs = [v[i] for v in self.recent if _known(v[i])]
+            out.append(sum(xs) / len(xs) if xs else None)
+        return tuple(out)
+
+    def suggest_grind(self, target_time: float = TARGET_TIME):
+        """Næste kværnindstilling ud fra tendensen kværn→tid.
+
+        Holdes inden for det afprøvede område ± halvdelen af dets bredde
+        (mindst ét trin), så en usikker linje ikke sender forslaget langt væk.
+        """
+        x = self.grind_time.solve(target_time)
+        if x is None:
+            return None
+        span = max(1.0, self.grind_max - self.grind_min)
+        lo, hi = self.grind_min - span / 2, self.grind_max + span / 2
+        return round(min(hi, max(lo, x)), 1)
+
+
+def rolling_mean(values, k: int = ROLLING):
+    """Rullende gennemsnit over `k` shots (NaN ignoreres), vektoriseret."""
+    import numpy as np
+
+    v = np.asarray(values, dtype=np.float64)
+    ok = ~np.isnan(v)
+    sums = np.convolve(np.where(ok, v, 0.0), np.ones(k), mode="full")[:len(v)]
+    counts = np.convolve(ok.astype(np.float64), np.ones(k), mode="full")[:len(v)]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
@@ -1,12 +1,32 @@
+import concurrent.futures
+import contextlib
+import functools
 import io
 import math
-import re
+import os
+import sys
+import tempfile
+import threading
 import time
-import pandas as pd
 import streamlit as st
 
+import bulk
+import perf
+from analytics import BeanStats, rec_dose, recommend, recommend_batch, rolling_mean
+from shots import ShotStore, parse_float, slugify
+from gateway import GatedSpreadsheet, SheetsGateway, status_code
+from storage import (
+    IncrementalSheetsStorage, Journal, SharedCache, SQLiteStorage, WriteBehindStorage,
+)
+
 # --------------------------- App Config ------------------------------------
 st.set_page_config(page_title="Espresso Advisor", page_icon="☕", layout="wide")
+RUN_T0 = time.perf_counter()
+
+# Målinger pr. session (og samlet for processen i perf.PROCESS)
+if "perf" not in st.session_state:
+    st.session_state.perf = perf.Recorder()
+perf.bind_session(st.session_state.perf)
 
 # =========================== SIMPLE VERSION ================================
 # MÅL: så simpelt som muligt
@@ -17,7 +37,10 @@ st.set_page_config(page_title="Espresso Advisor", page_icon="☕", layout="wide"
 # - Se historik for valgt bønne
 # - Gem alt i Google Sheets (to faner: beans, entries)
 
-# --------------------------- Sheets backend (valgfrit) ----------------------
+# --------------------------- Lager-backend (valgfrit) ----------------------
+# Google Sheets hvis secrets er sat op, ellers lokal SQLite hvis en sti er
+# angivet (secrets "sqlite_path" eller env KAFFE_SQLITE_PATH) – til udvikling
+# og loadtest. Uden nogen af dem lever data kun i sessionen.
 USE_SHEETS = False
 try:
     if "gcp_service_account" in st.secrets and ("gsheet_id" in st.secrets or "gsheet_name" in st.secrets):
@@ -25,12 +48,70 @@ try:
 except Exception:
     USE_SHEETS = False
 
+def setting(name: str, default):
+    """Valgfri indstilling fra secrets (env KAFFE_<NAVN> som fallback), i
+    samme type som `default`. Sandhedsværdier skal skrives som 1/true/yes/on
+    – alt andet (også "false" og "0") er False."""
+    value = os.environ.get("KAFFE_" + name.upper(), default)
+    try:
+        value = st.secrets.get(name, value)
+    except Exception:
+        pass
+    if isinstance(default, bool):
+        return str(value).strip().lower() in ("1", "true", "yes", "on")
+    if value is None or str(value).strip() == "":
+        return type(default)()  # tom = 0 / ""
+    return type(default)(value)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SQLITE_PATH = setting("sqlite_path", "")
+USE_SQLITE = (not USE_SHEETS) and bool(SQLITE_PATH)
+
+# Eksport af hele deploymentet (alle brugere) kun når det er slået til
+FULL_EXPORT = setting("full_export", False)
+
+# Lokal journal for ændringer der venter på Sheets. Hver serverproces låser
+# sin egen fil (JOURNAL_PATH.0, .1, ...), se Journal.for_process
+JOURNAL_PATH = setting("journal_path", "") or os.path.join(APP_DIR, ".kaffe-journal.jsonl")
+USE_STORAGE = USE_SHEETS or USE_SQLITE
+
+# Fælles disk-cache for alle serverprocesser på maskinen (tom sti = slået fra)
+SHARED_CACHE_PATH = setting("shared_cache_path", os.path.join(APP_DIR, ".kaffe-cache.sqlite"))
+
+# Arkivering af gamle shots (kun Sheets): rækker ældre end `archive_after_days`
+# eller ud over de nyeste `archive_keep_per_bean` pr. bønne flyttes til
+# arkivfaner ("entries_2024" …). 0/tom slår det enkelte kriterie fra, og
+# `archive_every_hours` = 0 slår arkiveringen helt fra.
+ARCHIVE_AFTER_DAYS = setting("archive_after_days", 365) or None
+ARCHIVE_KEEP_PER_BEAN = setting("archive_keep_per_bean", 200) or None
+ARCHIVE_PERIOD = setting("archive_period", "year")
+ARCHIVE_EVERY_HOURS = setting("archive_every_hours", 24.0)
+
+class StorageUnavailable(Exception):
+    """Lageret kan ikke åbnes; beskeden vises til brugeren."""
+
 if USE_SHEETS:
-    import gspread
-    from google.oauth2.service_account import Credentials
+    def observe_sheets(name, seconds, args, result, ok):
+        perf.record(f"sheets.{name}", seconds, perf.payload_size(args) + perf.payload_size(result), ok)
 
     @st.cache_resource(show_spinner=False)
+    def get_gateway():
+        """Ét rate limit/retry-lag for alle sessioner i processen."""
+        try:
+            per_minute = float(st.secrets.get("sheets_per_minute", 60))
+        except Exception:
+            per_minute = 60.0
+        return SheetsGateway(per_minute=per_minute, observer=observe_sheets)
+
+    GATEWAY = get_gateway()
+
     def get_sheet():
+        """Åbn arket. gspread/google-auth importeres først her (koldstart)."""
+        with perf.timer("startup.import_gspread"):
+            import gspread
+            from google.oauth2.service_account import Credentials
+
         scopes = ["https://www.googleapis.com/auth/spreadsheets"]
         creds = Credentials.from_service_account_info(
             st.secrets["gcp_service_account"], scopes=scopes
@@ -39,136 +120,286 @@ if USE_SHEETS:
 
         sheet_id = (st.secrets.get("gsheet_id") or "").strip()
         if not sheet_id:
-            st.error("Mangler 'gsheet_id' i Secrets (kopiér ID mellem /d/ og /edit i URL'en).")
-            st.stop()
+            raise StorageUnavailable("Mangler 'gsheet_id' i Secrets (kopiér ID mellem /d/ og /edit i URL'en).")
+
+        # Retry på 429/5xx klares af gatewayen; alt videre går også gennem den
+        try:
+            sh = GATEWAY.call(gc.open_by_key, sheet_id, lane="login")
+            return GatedSpreadsheet(sh, GATEWAY)
+        except gspread.exceptions.APIError as e:
+            code = status_code(e)
 
-        # Simple retry på 429 (rate limit)
-        last_err = None
-        for i in range(3):
-            try:
-                sh = gc.open_by_key(sheet_id)
-                return gc, sh
-            except gspread.exceptions.APIError as e:
-                code = getattr(getattr(e, "response", None), "status_code", None)
-                last_err = (e, code)
-                if code == 429 and i < 2:
-                    time.sleep(1 + i)
-                    continue
-                break
-
-        e, code = last_err
         svc = st.secrets["gcp_service_account"].get("client_email", "(service-konto)")
-        st.error(
+        raise StorageUnavailable(
             f"Kunne ikke åbne arket via ID (HTTP {code or 'ukendt'}). Tjek ID og del arket som Editor med {svc}."
         )
-        st.stop()
 
-    GC, SH = get_sheet()
+    def open_worksheets(sh, names: list) -> list:
+        """Find fanerne med ét worksheets()-kald; manglende oprettes. Headers
+        skrives af lageret ud fra første synk (ingen row_values pr. fane)."""
+        found = {w.title: w for w in sh.worksheets()}
+        return [found.get(n) or sh.add_worksheet(title=n, rows=1000, cols=20) for n in names]
 
-    def ws(name: str):
-        """Hent eller opret worksheet og initier headers."""
+def build_store():
+    """Forbind og byg den fælles Storage. Returnerer (spreadsheet, store)."""
+    with perf.timer("startup.store_ready"):
+        if USE_SHEETS:
+            sh = get_sheet()
+            with GATEWAY.lane("login"):
+                ws_beans, ws_entries = open_worksheets(sh, ["beans", "entries"])
+                # Med den delte cache henter kun én proces arket; de andre
+                # læser det fra disken (og ser hinandens skrivninger derfra)
+                shared = SharedCache(SHARED_CACHE_PATH, source=sh.id) if SHARED_CACHE_PATH else None
+                sheets = IncrementalSheetsStorage(ws_beans, ws_entries, spreadsheet=sh,
+                                                  archive_period=ARCHIVE_PERIOD, shared=shared)
+                # Første synk (begge faner på én gang) – så er login klar
+                sheets.ensure_headers()
+            if ARCHIVE_EVERY_HOURS > 0:
+                threading.Thread(target=compact_loop, args=(sheets,), daemon=True,
+                                 name="kaffe-compact").start()
+            # Skrivninger til Sheets går via write-behind-køen, så et gemt shot
+            # ikke venter på Google før st.rerun(). Køen journalføres på disk, så
+            # shots overlever genstart og Google-udfald. Læsninger er delta-synk.
+            store = WriteBehindStorage(sheets, journal=Journal.for_process(JOURNAL_PATH))
+            return sh, store
+        return None, SQLiteStorage(SQLITE_PATH)
+
+def compact_loop(sheets):
+    """Arkivér gamle shots med jævne mellemrum i baggrunden. Flere processer
+    kan køre løkken samtidig; lageret lader kun én komprimere ad gangen."""
+    time.sleep(60)  # ikke oven i login-trafikken ved opstart
+    while True:
         try:
-            w = SH.worksheet(name)
-        except Exception:
-            w = SH.add_worksheet(title=name, rows=1000, cols=20)
-        if name == "beans" and len(w.get_all_values()) == 0:
-            w.append_row(["user_id","bean_id","brand","name","process","target_ratio"])
-        if name == "entries" and len(w.get_all_values()) == 0:
-            w.append_row([
-                "user_id","bean_id","date","type","grind","dose","yield",
-                "time","target_ratio","target_out","ratio","advice","notes"
-            ])
-        return w
-
-    WS_BEANS = ws("beans")
-    WS_ENTRIES = ws("entries")
+            with GATEWAY.lane("diag"), perf.timer("storage.compact"):
+                sheets.compact(max_age_days=ARCHIVE_AFTER_DAYS, keep_per_bean=ARCHIVE_KEEP_PER_BEAN)
+        except Exception as e:
+            print(f"Arkivering fejlede: {e}", file=sys.stderr)
+        time.sleep(ARCHIVE_EVERY_HOURS * 3600)
+
+@st.cache_resource(show_spinner=False)
+def start_store():
+    """Start forbindelsen i baggrunden én gang pr. proces, så login-siden kan
+    vises med det samme. Headers tjekkes kun her (cachet for processens levetid)."""
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="store-init")
+    return pool.submit(build_store)
+
+STORE_FUTURE = start_store() if USE_STORAGE else None
+SH, STORE = None, None
+
+def store_ready() -> bool:
+    return STORE is not None or (STORE_FUTURE is not None and STORE_FUTURE.done())
+
+def require_store():
+    """Vent på lageret (med spinner). Stopper siden hvis det ikke kan åbnes."""
+    global SH, STORE
+    if STORE is None:
+        try:
+            with st.spinner("Forbinder til lager…"):
+                SH, STORE = STORE_FUTURE.result()
+        except Exception as e:
+            start_store.clear()  # prøv forfra ved næste rerun
+            st.error(str(e) if isinstance(e, StorageUnavailable) else f"Kunne ikke forbinde til lager: {e}")
+            st.stop()
+    return STORE
+
+def sheets_lane(name: str):
+    """Prioritet for Sheets-kald i en blok ("login", "diag", ...)."""
+    return GATEWAY.lane(name) if USE_SHEETS else contextlib.nullcontext()
 
 # --------------------------- Helpers ---------------------------------------
 PROCESS_CHOICES = [
     "Washed","Natural","Honey","Anaerob","CM","Giling Basah","Wet-Hulled","Andet"
 ]
 
-def slugify(s: str) -> str:
-    s = (s or "").strip().lower()
-    s = re.sub(r"[^a-z0-9]+", "-", s)
-    return s.strip("-") or "bean"
-
-def parse_float(x):
-    try:
-        if x is None:
-            return None
-        if isinstance(x, (int, float)):
-            return float(x)
-        x = str(x).replace(",", ".").strip()
-        return float(x) if x != "" else None
-    except Exception:
-        return None
-
-def rec_dose(shot_type: str):
-    return 9.0 if shot_type == "Single" else 18.0 if shot_type == "Double" else None
-
-def recommend(ratio, time_sec, target_out):
-    has_r = ratio is not None and ratio == ratio
-    has_t = time_sec is not None and time_sec == time_sec
-    if has_r and has_t and 1.8 <= ratio <= 2.2 and 25 <= time_sec <= 30:
-        return "✅ God ekstraktion – behold indstillingerne.", "good"
-    if (has_t and time_sec < 25) or (has_r and ratio > 2.2):
-        return f"Underekstraheret → Mal finere (lavere tal) og/eller stop ved {round(target_out)} g.", "under"
-    if (has_t and time_sec > 30) or (has_r and ratio < 1.8):
-        return f"Overekstraheret → Mal grovere (højere tal). Hold dig til {round(target_out)} g.", "over"
-    return f"Juster småt: sigt efter 25–30 sek og {round(target_out)} g.", "neutral"
-
-# --------------------------- Sheets I/O ------------------------------------
-if USE_SHEETS:
-    @st.cache_data(ttl=60, show_spinner=False)
+# Fragmenter kører om for sig selv (Streamlit ≥ 1.37; ældre: hele scriptet)
+_st_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+def fragment(fn):
+    """st.fragment, der også binder sessionens målinger ved delvise reruns."""
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        perf.bind_session(st.session_state.perf)
+        return fn(*args, **kwargs)
+    return _st_fragment(run) if _st_fragment else run
+
+def bean_shots(bean: dict) -> ShotStore:
+    """Bønnens shots som kolonnelager i bean["shots"] (nyeste først)."""
+    shots = bean.get("shots")
+    if shots is None:
+        shots = bean["shots"] = ShotStore.from_entries(bean.pop("entries", []))
+    return shots
+
+def ensure_history(bean_id: str, bean: dict, n):
+    """Sørg for at de nyeste `n` shots (None = alle) ligger i bean["shots"].
+
+    Hentes i vinduer fra lageret; der hentes kun de shots der mangler.
+    Arkiverede shots (ældre end de aktive) hentes kun når der bedes om
+    flere end de aktive.
+    """
+    shots = bean_shots(bean)
+    if not USE_STORAGE:
+        return shots
+    store = require_store()
+    epoch = store.compaction_epoch()
+    if bean.setdefault("epoch", epoch) != epoch:
+        # Arkiveret siden historikken blev hentet: offsets og totaler passer
+        # ikke længere, så hent forfra (analysen dækker hele historikken og
+        # er uændret)
+        bean["epoch"] = epoch
+        bean.pop("entries_total", None)
+        bean.pop("archived_total", None)
+        shots = bean["shots"] = ShotStore()
+    if "entries_total" not in bean:
+        bean["entries_total"] = store.count_entries(USER_ID, bean_id)
+    hot = bean["entries_total"]
+    if (n is None or n > hot) and "archived_total" not in bean:
+        with perf.timer("storage.count_archived"):
+            bean["archived_total"] = store.count_archived(USER_ID, bean_id)
+    total = hot + bean.get("archived_total", 0)
+    want = total if n is None else min(n, total)
+    if len(shots) < min(want, hot):
+        with perf.timer("storage.load_entries"):
+            shots.extend_older(store.load_entries(
+                USER_ID, bean_id, limit=min(want, hot) - len(shots), offset=len(shots)
+            ))
+    if len(shots) < want:
+        with perf.timer("storage.load_archived"):
+            shots.extend_older(store.load_archived(
+                USER_ID, bean_id, limit=want - len(shots), offset=len(shots) - hot
+            ))
+    return shots
+
+def pandas():
+    """pandas importeres først når tabelvisningen bruger det (koldstart)."""
+    if "pandas" not in sys.modules:
+        with perf.timer("startup.import_pandas"):
+            import pandas  # noqa: F401
+    return sys.modules["pandas"]
+
+def bean_stats(bean_id: str, bean: dict) -> BeanStats:
+    """Løbende analyse for bønnen; bygges første gang ud fra hele historikken
+    og opdateres derefter ved hvert gemt shot (se shot_form)."""
+    if "stats" not in bean:
+        shots = ensure_history(bean_id, bean, None)
+        with perf.timer("analytics.build"):
+            bean["stats"] = BeanStats.from_shots(shots)
+    return bean["stats"]
+
+# --------------------------- Lager I/O -------------------------------------
+if USE_STORAGE:
+    # Ingen st.cache_data her: backenden holder selv sin cache og henter kun
+    # nye rækker, så hver læsning er billig og aldrig 60 sek. gammel
     def load_user_data(user_id: str):
-        beans: dict[str, dict] = {}
-        for row in WS_BEANS.get_all_records():
-            if row.get("user_id") == user_id:
-                bid = row["bean_id"]
-                beans[bid] = {
-                    "brand": row.get("brand",""),
-                    "name": row.get("name",""),
-                    "process": row.get("process",""),
-                    "target_ratio": float(row.get("target_ratio", 2.0)),
-                    "entries": [],
-                }
-        if beans:
-            for row in WS_ENTRIES.get_all_records():
-                if row.get("user_id") == user_id and row.get("bean_id") in beans:
-                    beans[row["bean_id"]]["entries"].append({
-                        "Dato": row.get("date",""),
-                        "Type": row.get("type",""),
-                        "Kværn": row.get("grind",""),
-                        "Dosis (g)": row.get("dose",""),
-                        "Udbytte (g)": row.get("yield",""),
-                        "Tid (sek)": row.get("time",""),
-                        "Target ratio": row.get("target_ratio",""),
-                        "Mål ud (g)": row.get("target_out",""),
-                        "Faktisk ratio": row.get("ratio",""),
-                        "Anbefaling": row.get("advice",""),
-                        "Noter": row.get("notes", ""),
-                    })
-        return beans
+        """Bønner uden shots – historikken hentes pr. bønne når den vises."""
+        with perf.timer("storage.load_user_data"):
+            return require_store().load_user_data(user_id, entries_limit=0)
 
     def upsert_bean(user_id: str, bean_id: str, bean: dict):
-        rows = WS_BEANS.get_all_values()
-        if rows:
-            for idx, r in enumerate(rows[1:], start=2):
-                if len(r) >= 2 and r[0] == user_id and r[1] == bean_id:
-                    WS_BEANS.update(
-                        f"A{idx}:F{idx}",
-                        [[user_id, bean_id, bean.get('brand',''), bean.get('name',''), bean.get('process',''), bean.get('target_ratio',2.0)]]
-                    )
-                    return
-        WS_BEANS.append_row([user_id, bean_id, bean.get('brand',''), bean.get('name',''), bean.get('process',''), bean.get('target_ratio',2.0)])
+        with perf.timer("storage.upsert_bean"):
+            require_store().upsert_bean(user_id, bean_id, bean)
 
     def append_entry(user_id: str, bean_id: str, entry: dict):
-        WS_ENTRIES.append_row([
-            user_id, bean_id, entry.get("Dato",""), entry.get("Type",""), entry.get("Kværn",""),
-            entry.get("Dosis (g)",""), entry.get("Udbytte (g)",""), entry.get("Tid (sek)",""),
-            entry.get("Target ratio",""), entry.get("Mål ud (g)",""), entry.get("Faktisk ratio",""), entry.get("Anbefaling",""), entry.get("Noter",""),
-        ])
+        with perf.timer("storage.append_entry"):
+            require_store().append_entry(user_id, bean_id, entry)
+
+# --------------------------- Ydelse & diagnose -----------------------------
+def render_perf_panel(user_id: str = ""):
+    """Målinger (session/proces) med eksport, plus lagerstatus."""
+    with st.expander("📊 Ydelse & diagnose", expanded=False), sheets_lane("diag"):
+        scope = st.radio("Målinger for", ["Session", "Proces"], horizontal=True, key="perf_scope")
+        rec = st.session_state.perf if scope == "Session" else perf.PROCESS
+        rows = rec.rows()
+        if rows:
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+        else:
+            st.caption("Ingen målinger endnu.")
+        c1, c2, c3 = st.columns(3)
+        c1.download_button("⬇️ JSON", rec.to_json(), file_name=f"perf-{scope.lower()}.json",
+                           mime="application/json", key="perf_json")
+        c2.download_button("⬇️ CSV", rec.to_csv(), file_name=f"perf-{scope.lower()}.csv",
+                           mime="text/csv", key="perf_csv")
+        if c3.button("Nulstil målinger", key="perf_reset"):
+            rec.reset()
+            st.rerun()
+
+        if not USE_STORAGE:
+            return
+        if not store_ready():
+            st.caption("Forbinder til lager…")
+            return
+        require_store()
+        # Kun tællere og snapshot herunder – ingen ekstra Sheets-kald pr. visning
+        try:
+            st.write(f"Backend: **{STORE.name}** · venter på synk: {STORE.pending()}")
+            if USE_SHEETS:
+                api_calls = sum(r["kald"] for r in perf.PROCESS.rows() if r["navn"].startswith("sheets."))
+                st.write(f"Sheet: **{SH.title}** (ID sløret) · API-kald i processen: {api_calls}"
+                         f" · retries: {GATEWAY.retries}")
+                heads = STORE.headers()
+                st.write("beans header:", heads["beans"])
+                st.write("entries header:", heads["entries"])
+            if user_id:
+                nb, ne = STORE.count_rows(user_id)
+                st.write(f"Rækker for {user_id}: beans={nb}, entries={ne}")
+            if getattr(STORE, "last_error", None):
+                st.warning(f"Seneste synkfejl (prøver igen): {STORE.last_error}")
+        except Exception as e:
+            st.error(f"Diagnosefejl: {e}")
+        if user_id and st.button("🔁 Genindlæs fra lager nu", key="perf_reload"):
+            STORE.reload()
+            st.session_state.beans = load_user_data(user_id)
+            st.success("Genindlæst fra lager")
+            st.rerun()
+
+# --------------------------- Import & eksport -----------------------------
+def render_bulk_panel(user_id: str):
+    """Import fra fil og eksport til fil, begge i bidder (se bulk.py)."""
+    with st.expander("📦 Import & eksport", expanded=False):
+        fmt = st.radio("Format", ["csv", "parquet"], horizontal=True, key="bulk_fmt")
+
+        up = st.file_uploader("Importér bønner og shots", type=["csv", "parquet"], key="bulk_file")
+        if up is not None and st.button("Importér", key="bulk_import"):
+            bar = st.progress(0.0, text="Importerer…")
+            size = max(1, up.size)
+
+            def progress(res):
+                bar.progress(min(1.0, up.tell() / size), text=f"{res.shots} shots importeret…")
+
+            fmt_in = "parquet" if up.name.lower().endswith(".parquet") else "csv"
+            try:
+                with perf.timer("bulk.import"):
+                    res = bulk.import_file(require_store(), up, fmt_in, user_id=user_id, progress=progress)
+            except Exception as e:
+                st.error(f"Import fejlede: {e}")
+            else:
+                bar.progress(1.0, text="Færdig")
+                st.success(f"Importeret: {res.beans} bønner og {res.shots} shots"
+                           f" ({res.rejected} rækker sprunget over).")
+                for line, msg in res.errors[:20]:
+                    st.caption(f"Linje {line}: {msg}")
+                st.session_state.beans = load_user_data(user_id)
+
+        scope = "Mig"
+        if FULL_EXPORT:
+            scope = st.radio("Eksportér", ["Mig", "Alle brugere"], horizontal=True, key="bulk_scope")
+        if st.button("Forbered eksport", key="bulk_export"):
+            # Skrives i bidder til en midlertidig fil – ikke som én stor liste –
+            # og gives til download-knappen i samme kørsel. Intet gemmes i
+            # session state, så eksporten slippes igen ved næste rerun.
+            tmp = tempfile.TemporaryFile()
+            try:
+                with perf.timer("bulk.export"):
+                    n = bulk.export_file(require_store(), tmp, fmt,
+                                         user_id=None if scope == "Alle brugere" else user_id)
+                tmp.seek(0)
+                st.download_button(f"⬇️ Hent eksport ({n} rækker)", tmp, file_name=f"kaffe-export.{fmt}",
+                                   mime="text/csv" if fmt == "csv" else "application/octet-stream",
+                                   key="bulk_download")
+                st.caption("Linket gælder indtil du klikker på noget andet.")
+            except Exception as e:
+                st.error(f"Eksport fejlede: {e}")
+            finally:
+                tmp.close()
 
 # --------------------------- State -----------------------------------------
 if "user_id" not in st.session_state:
@@ -193,8 +424,9 @@ except Exception:
 
 if user_from_url and ("user_id" not in st.session_state or not st.session_state.user_id):
     st.session_state.user_id = user_from_url
-    if USE_SHEETS:
-        st.session_state.beans = load_user_data(user_from_url)
+    if USE_STORAGE:
+        with sheets_lane("login"):
+            st.session_state.beans = load_user_data(user_from_url)
     st.rerun()
 
 if not st.session_state.user_id:
@@ -202,16 +434,16 @@ if not st.session_state.user_id:
     st.caption("Skriv et brugernavn/alias. Dine bønner og shots gemmes i Google Sheets under dette ID.")
     user_input = st.text_input("Bruger-ID", placeholder="fx jonas_home")
 
-    # Hjælp: vælg et eksisterende alias fundet i arket
-    if USE_SHEETS:
-        @st.cache_data(ttl=60, show_spinner=False)
+    # Hjælp: vælg et eksisterende alias fundet i arket (når forbindelsen er klar –
+    # login-feltet vises med det samme uden at vente på Google)
+    if USE_STORAGE and not store_ready():
+        st.caption("Forbinder til arket… listen over brugere vises om lidt.")
+    elif USE_STORAGE:
+        # Læses fra backendens proces-fælles snapshot (ingen ekstra download)
         def list_user_ids():
             try:
-                vals = WS_BEANS.get_all_values()
-                if not vals or len(vals) < 2:
-                    return []
-                # kolonne A antages at være 'user_id'
-                return sorted(list({r[0] for r in vals[1:] if r and r[0]}))
+                with sheets_lane("login"):
+                    return require_store().list_user_ids()
             except Exception:
                 return []
         existing_users = list_user_ids()
@@ -226,8 +458,9 @@ if not st.session_state.user_id:
             uid = (user_input or "").strip()
             if uid:
                 st.session_state.user_id = uid
-                if USE_SHEETS:
-                    st.session_state.beans = load_user_data(uid)
+                if USE_STORAGE:
+                    with sheets_lane("login"):
+                        st.session_state.beans = load_user_data(uid)
                     # Skriv alias i URL så du kan bogmærke
                     try:
                         st.query_params["user"] = uid
@@ -236,24 +469,15 @@ if not st.session_state.user_id:
                 st.rerun()
             else:
                 st.warning("Indtast et Bruger-ID for at fortsætte.")
-    # Lille diagnose ved login hvis Sheets er aktivt
-    if USE_SHEETS:
-        with st.expander("🔧 Diagnose (Google Sheets)", expanded=False):
-            try:
-                sheet_title = SH.title
-                st.write(f"Sheet: **{sheet_title}** (ID sløret)")
-                st.write("Arbejdssheets:", [w.title for w in SH.worksheets()])
-                beans_head = WS_BEANS.row_values(1)
-                entries_head = WS_ENTRIES.row_values(1)
-                st.write("beans header:", beans_head)
-                st.write("entries header:", entries_head)
-                st.write("Fundne brugere:", existing_users)
-            except Exception as e:
-                st.error(f"Kan ikke læse diagnose: {e}")
+    # Lille diagnose ved login
+    render_perf_panel()
+    perf.record("startup.login_render", time.perf_counter() - RUN_T0)
     st.stop()
 
-# Hvis vi allerede er logget ind men ingen data i denne session → hent fra Sheets
-if USE_SHEETS and st.session_state.user_id and not st.session_state.beans:
+# Hvis vi allerede er logget ind men ingen data i denne session → hent fra lager
+if USE_STORAGE:
+    require_store()
+if USE_STORAGE and st.session_state.user_id and not st.session_state.beans:
     st.session_state.beans = load_user_data(st.session_state.user_id)
 
 USER_ID = st.session_state.user_id
@@ -261,88 +485,71 @@ beans = st.session_state.beans
 
 # --------------------------- Bean vælger / opret ---------------------------
 st.caption(f"Logget ind som **{st.session_state.user_id}** · delbart link: ?user={st.session_state.user_id}")
-
-# Ekstra diagnose inde i appen
-if USE_SHEETS:
-    with st.expander("🔧 Diagnose / Reparer Sheets", expanded=False):
-        exp_col1, exp_col2 = st.columns(2)
-        with exp_col1:
-            try:
-                st.write("Sheets:", [w.title for w in SH.worksheets()])
-                st.write("beans header:", WS_BEANS.row_values(1))
-                st.write("entries header:", WS_ENTRIES.row_values(1))
-                # antal rækker for denne bruger
-                import itertools
-                beans_rows = WS_BEANS.get_all_records()
-                entries_rows = WS_ENTRIES.get_all_records()
-                nb = sum(1 for r in beans_rows if r.get("user_id") == USER_ID)
-                ne = sum(1 for r in entries_rows if r.get("user_id") == USER_ID)
-                st.write(f"Rækker for {USER_ID}: beans={nb}, entries={ne}")
-            except Exception as e:
-                st.error(f"Diagnosefejl: {e}")
-        with exp_col2:
-            if st.button("🔁 Genindlæs fra Sheets nu"):
-                try:
-                    if 'load_user_data' in globals():
-                        load_user_data.clear()
-                except Exception:
-                    pass
-                st.session_state.beans = load_user_data(USER_ID)
-                st.success("Genindlæst fra Sheets")
-                st.rerun()
-
-left, right = st.columns([1,1])
-with left:
-    if beans:
-        labels = [f"{b['brand']} – {b['name']}" for b in beans.values()]
-        options = ["(Vælg bønne)"] + labels
-
-        # Forvælg aktuelt valg hvis muligt
-        cur_label = "(Vælg bønne)"
-        if st.session_state.current_bean in beans:
-            bcur = beans[st.session_state.current_bean]
-            cur_label = f"{bcur['brand']} – {bcur['name']}"
-        idx = options.index(cur_label) if cur_label in options else 0
-
-        sel = st.selectbox("Aktiv bønne", options, index=idx)
-        if sel != "(Vælg bønne)":
-            for bid, b in beans.items():
-                if f"{b['brand']} – {b['name']}" == sel:
+if USE_STORAGE and STORE.pending():
+    st.caption(f"⏳ {STORE.pending()} ændring(er) venter på synk")
+
+# Ydelse & diagnose inde i appen
+render_perf_panel(USER_ID)
+if USE_STORAGE:
+    render_bulk_panel(USER_ID)
+
+@fragment
+def bean_picker():
+    """Vælg/opret bønne. Fuld rerun kun når aktiv bønne skifter eller oprettes."""
+    with perf.timer("render.bean_picker"):
+        left, right = st.columns([1,1])
+        with left:
+            if beans:
+                labels = [f"{b['brand']} – {b['name']}" for b in beans.values()]
+                options = ["(Vælg bønne)"] + labels
+
+                # Forvælg aktuelt valg hvis muligt
+                cur_label = "(Vælg bønne)"
+                if st.session_state.current_bean in beans:
+                    bcur = beans[st.session_state.current_bean]
+                    cur_label = f"{bcur['brand']} – {bcur['name']}"
+                idx = options.index(cur_label) if cur_label in options else 0
+
+                sel = st.selectbox("Aktiv bønne", options, index=idx)
+                if sel != "(Vælg bønne)":
+                    for bid, b in beans.items():
+                        if f"{b['brand']} – {b['name']}" == sel:
+                            if st.session_state.current_bean != bid:
+                                st.session_state.current_bean = bid
+                                # Resten af siden afhænger af aktiv bønne
+                                st.rerun()
+                            break
+        with right:
+            with st.expander("➕ Ny bønne", expanded=(not beans)):
+                n_brand = st.text_input("Mærke / Risteri", key="k_new_brand")
+                n_name = st.text_input("Bønne / Navn", key="k_new_name")
+                n_proc = st.selectbox("Proces", PROCESS_CHOICES, index=0, key="k_new_proc")
+                n_ratio = st.selectbox("Target ratio", [1.8,1.9,2.0,2.1,2.2], index=2, key="k_new_ratio")
+                if st.button("Opret bønne", key="k_new_btn_create"):
+                    base = slugify(f"{n_brand}-{n_name}")
+                    bid = base or "bean"
+                    i = 2
+                    while bid in beans:
+                        bid = f"{base}-{i}"
+                        i += 1
+
+                    beans[bid] = {
+                        "brand": (n_brand or "").strip(),
+                        "name": (n_name or "").strip(),
+                        "process": n_proc,
+                        "target_ratio": float(n_ratio),
+                        "shots": ShotStore(),
+                    }
+                    # Sæt aktiv bønne og sørg for lokal state
                     st.session_state.current_bean = bid
-                    break
-with right:
-    with st.expander("➕ Ny bønne", expanded=(not beans)):
-        n_brand = st.text_input("Mærke / Risteri", key="k_new_brand")
-        n_name = st.text_input("Bønne / Navn", key="k_new_name")
-        n_proc = st.selectbox("Proces", PROCESS_CHOICES, index=0, key="k_new_proc")
-        n_ratio = st.selectbox("Target ratio", [1.8,1.9,2.0,2.1,2.2], index=2, key="k_new_ratio")
-        if st.button("Opret bønne", key="k_new_btn_create"):
-            base = slugify(f"{n_brand}-{n_name}")
-            bid = base or "bean"
-            i = 2
-            while bid in beans:
-                bid = f"{base}-{i}"
-                i += 1
-
-            beans[bid] = {
-                "brand": (n_brand or "").strip(),
-                "name": (n_name or "").strip(),
-                "process": n_proc,
-                "target_ratio": float(n_ratio),
-                "entries": [],
-            }
-            # Sæt aktiv bønne og sørg for lokal state
-            st.session_state.current_bean = bid
-            st.session_state.beans[bid] = beans[bid]
-            # Gem i Sheets hvis aktiveret (ingen reload af data her)
-            if USE_SHEETS:
-                upsert_bean(USER_ID, bid, beans[bid])
-                try:
-                    load_user_data.clear()
-                except Exception:
-                    pass
-            st.success("Bønne oprettet! Klar til at logge shots.")
-            st.rerun()
+                    st.session_state.beans[bid] = beans[bid]
+                    # Gem i lager hvis aktiveret (ingen reload af data her)
+                    if USE_STORAGE:
+                        upsert_bean(USER_ID, bid, beans[bid])
+                    st.success("Bønne oprettet! Klar til at logge shots.")
+                    st.rerun()
+
+bean_picker()
 
 if not st.session_state.current_bean:
     st.info("Vælg en eksisterende bønne eller opret en ny.")
@@ -362,113 +569,202 @@ colB.markdown(f"**Bønne:** {bean['name'] or '—'}")
 colC.metric("Proces", bean.get("process") or "—")
 
 # --------------------------- Shot form -------------------------------------
-with st.form("shot_form"):
-    c1, c2 = st.columns(2)
-    with c1:
-        shot_type = st.selectbox("Shot type", ["Double","Single"], index=0, key=f"type_{bean_id}")
-        grind = st.text_input("Kværn (tal)", placeholder="fx 8", key=f"grind_{bean_id}")
-        dose = parse_float(st.text_input("Dosis (g ind)", placeholder=str(rec_dose(shot_type) or ""), key=f"dose_{bean_id}"))
-    with c2:
-        yield_out = parse_float(st.text_input("Udbytte (g ud)", placeholder="fx 36", key=f"yield_{bean_id}"))
-        time_sec = parse_float(st.text_input("Tid (sek, fra første dråbe)", placeholder="fx 27", key=f"time_{bean_id}"))
-        date_str = st.date_input("Dato", key=f"date_{bean_id}")
-    note = st.text_input("Noter (valgfri)", placeholder="Smagsnoter, mælketekstur, vand…", key=f"note_{bean_id}")
-
-    target_ratio = bean.get("target_ratio", 2.0)
-    target_out = (dose * target_ratio) if dose is not None else (rec_dose(shot_type) or 0) * target_ratio
-    ratio = (yield_out / dose) if (dose and yield_out) else None
-    advice, kind = recommend(ratio, time_sec, target_out or 0)
-
-    m1, m2 = st.columns(2)
-    m1.metric("Mål udbytte (g)", value=(str(int(round(target_out))) if target_out else "—"))
-    m2.metric("Faktisk ratio", value=(f"{ratio:.2f}" if ratio else "—"))
-
-    bg = {"good":"#DCFCE7","under":"#FEF3C7","over":"#FECACA","neutral":"#F5F5F4"}.get(kind,"#F5F5F4")
-    st.markdown(
-        f"<div style='border:1px solid #e5e7eb;background:{bg};padding:12px;border-radius:12px'>{advice}</div>",
-        unsafe_allow_html=True,
-    )
-
-    submitted = st.form_submit_button("Gem shot i aktiv bønne", use_container_width=True)
-
-    if submitted:
-        entry = {
-            "Dato": str(date_str),
-            "Type": shot_type,
-            "Kværn": grind,
-            "Dosis (g)": dose if dose is not None else "",
-            "Udbytte (g)": yield_out if yield_out is not None else "",
-            "Tid (sek)": time_sec if time_sec is not None else "",
-            "Target ratio": target_ratio,
-            "Mål ud (g)": int(round(target_out)) if target_out else "",
-            "Faktisk ratio": round(ratio,2) if ratio else "",
-            "Anbefaling": advice,
-            "Noter": note or "",
-        }
-        # Opdater KUN lokal state her — ingen fetch, så bønnen ikke forsvinder
-        st.session_state.beans.setdefault(bean_id, bean)
-        st.session_state.beans[bean_id].setdefault("entries", []).insert(0, entry)
+@fragment
+def shot_form(bean_id: str, bean: dict):
+    """Shot-input med live mål, ratio og anbefaling. Indtastning kører kun
+    dette fragment; hele siden køres først når et shot er gemt."""
+    with perf.timer("render.shot_form"):
+        c1, c2 = st.columns(2)
+        with c1:
+            shot_type = st.selectbox("Shot type", ["Double","Single"], index=0, key=f"type_{bean_id}")
+            grind = st.text_input("Kværn (tal)", placeholder="fx 8", key=f"grind_{bean_id}")
+            dose = parse_float(st.text_input("Dosis (g ind)", placeholder=str(rec_dose(shot_type) or ""), key=f"dose_{bean_id}"))
+        with c2:
+            yield_out = parse_float(st.text_input("Udbytte (g ud)", placeholder="fx 36", key=f"yield_{bean_id}"))
+            time_sec = parse_float(st.text_input("Tid (sek, fra første dråbe)", placeholder="fx 27", key=f"time_{bean_id}"))
+            date_str = st.date_input("Dato", key=f"date_{bean_id}")
+        note = st.text_input("Noter (valgfri)", placeholder="Smagsnoter, mælketekstur, vand…", key=f"note_{bean_id}")
+
+        target_ratio = bean.get("target_ratio", 2.0)
+        target_out = (dose * target_ratio) if dose is not None else (rec_dose(shot_type) or 0) * target_ratio
+        ratio = (yield_out / dose) if (dose and yield_out) else None
+        advice, kind = recommend(ratio, time_sec, target_out or 0)
+
+        m1, m2 = st.columns(2)
+        m1.metric("Mål udbytte (g)", value=(str(int(round(target_out))) if target_out else "—"))
+        m2.metric("Faktisk ratio", value=(f"{ratio:.2f}" if ratio else "—"))
+
+        bg = {"good":"#DCFCE7","under":"#FEF3C7","over":"#FECACA","neutral":"#F5F5F4"}.get(kind,"#F5F5F4")
+        st.markdown(
+            f"<div style='border:1px solid #e5e7eb;background:{bg};padding:12px;border-radius:12px'>{advice}</div>",
+            unsafe_allow_html=True,
+        )
 
-        if USE_SHEETS:
-            # Persistér men lad lokal state være "source of truth" for dette run
-            upsert_bean(USER_ID, bean_id, st.session_state.beans[bean_id])
-            append_entry(USER_ID, bean_id, entry)
-            try:
-                load_user_data.clear()
-            except Exception:
-                pass
-        st.success("✅ Shot gemt!")
-        # Bevar kontekst før rerun
-        st.session_state.user_id = USER_ID
-        st.session_state.current_bean = bean_id
-        st.rerun()
+        submitted = st.button("Gem shot i aktiv bønne", type="primary",
+                              use_container_width=True, key=f"save_{bean_id}")
+
+        if submitted:
+            entry = {
+                "Dato": str(date_str),
+                "Type": shot_type,
+                "Kværn": grind,
+                "Dosis (g)": dose if dose is not None else "",
+                "Udbytte (g)": yield_out if yield_out is not None else "",
+                "Tid (sek)": time_sec if time_sec is not None else "",
+                "Target ratio": target_ratio,
+                "Mål ud (g)": int(round(target_out)) if target_out else "",
+                "Faktisk ratio": round(ratio,2) if ratio else "",
+                "Anbefaling": advice,
+                "Noter": note or "",
+            }
+            # Opdater KUN lokal state her — ingen fetch, så bønnen ikke forsvinder
+            st.session_state.beans.setdefault(bean_id, bean)
+            bean_shots(st.session_state.beans[bean_id]).insert_newest(entry)
+            if "stats" in st.session_state.beans[bean_id]:
+                st.session_state.beans[bean_id]["stats"].add(
+                    parse_float(grind), parse_float(entry["Faktisk ratio"]), time_sec
+                )
+            if "entries_total" in st.session_state.beans[bean_id]:
+                st.session_state.beans[bean_id]["entries_total"] += 1
+
+            if USE_STORAGE:
+                # Persistér men lad lokal state være "source of truth" for dette run
+                upsert_bean(USER_ID, bean_id, st.session_state.beans[bean_id])
+                append_entry(USER_ID, bean_id, entry)
+            st.success("✅ Shot gemt!")
+            # Bevar kontekst før rerun
+            st.session_state.user_id = USER_ID
+            st.session_state.current_bean = bean_id
+            st.rerun()
+
+shot_form(bean_id, bean)
+
+# --------------------------- Dial-in analyse -------------------------------
+@fragment
+def analysis(bean_id: str, bean: dict):
+    """Tendenser, hit rate og forslag til næste kværn. Kræver hele historikken,
+    så den hentes først når analysen slås til."""
+    toggle = getattr(st, "toggle", st.checkbox)
+    if not toggle("📈 Vis dial-in analyse", key=f"analysis_{bean_id}"):
+        return
+    with perf.timer("render.analysis"):
+        stats = bean_stats(bean_id, bean)
+        if not stats.shots:
+            st.info("Ingen shots endnu – gem et shot for at se analyse.")
+            return
+
+        hit = stats.hit_rate()
+        avg_ratio, avg_time = stats.rolling()
+        nxt = stats.suggest_grind()
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Hit rate", f"{hit:.0%}" if hit is not None else "—",
+                  help=f"Andel af {stats.scored} målte shots med ratio 1.8–2.2 og 25–30 sek")
+        m2.metric("Gns. ratio (seneste 5)", f"{avg_ratio:.2f}" if avg_ratio is not None else "—")
+        m3.metric("Gns. tid (seneste 5)", f"{avg_time:.1f} s" if avg_time is not None else "—")
+        m4.metric("Forslag: næste kværn", f"{nxt:g}" if nxt is not None else "—",
+                  help="Hvor tendensen kværn→tid rammer 27,5 sek")
+
+        trends = []
+        b = stats.grind_time.slope()
+        if b is not None:
+            trends.append(f"tid {b:+.1f} sek pr. kværntrin")
+        b = stats.grind_ratio.slope()
+        if b is not None:
+            trends.append(f"ratio {b:+.2f} pr. kværntrin")
+        if trends:
+            st.caption("Tendens: " + ", ".join(trends) + f" (over {stats.grind_time.n} shots).")
+        else:
+            st.caption("For få shots med forskellig kværn til en tendens.")
+        labels = {"good": "✅ god", "under": "under", "over": "over", "neutral": "neutral"}
+        st.caption("Fordeling: " + " · ".join(
+            f"{labels[k]} {stats.kinds[k]}" for k in labels if stats.kinds[k]
+        ))
+
+        # Rullende gennemsnit over hele historikken (ældste først)
+        shots = bean_shots(bean)
+        if len(shots) >= 2:
+            pd = pandas()
+            with perf.timer("render.analysis_chart"):
+                chart = pd.DataFrame({
+                    "Ratio (rullende)": rolling_mean(shots.values("ratio")[::-1]),
+                    "Tid/10 (rullende)": rolling_mean(shots.values("time")[::-1]) / 10,
+                })
+                st.line_chart(chart, height=200)
+
+        # Genvurdér hele historikken med de nuværende grænser
+        if st.button("Genvurdér alle shots", key=f"rescore_{bean_id}"):
+            with perf.timer("analytics.rescore"):
+                advice, _ = recommend_batch(
+                    shots.values("ratio"), shots.values("time"), shots.values("target_out")
+                )
+                df = shots.to_frame()
+                df["Anbefaling"] = advice
+            st.dataframe(df, use_container_width=True, hide_index=True)
+
+analysis(bean_id, bean)
 
 # --------------------------- Historik --------------------------------------
-st.subheader("Historik for valgt bønne")
-entries = bean.get("entries", [])
-# Vi undgår at overskrive lokal state her; Sheets læses først ved login/opstart
-
-# Kontrolleret visning til mobil: kort eller tabel
-if hasattr(st, 'segmented_control'):
-    view = st.segmented_control("Visning", options=["Kort", "Tabel"], default="Kort")
-else:
-    view = st.radio("Visning", ["Kort","Tabel"], horizontal=True)
-limit_opt = st.selectbox("Antal viste", [5,10,25,50,"Alle"], index=1)
-
-# Nyeste først (entries er allerede indsat i toppen)
-data = entries[:]
-if limit_opt != "Alle":
-    data = data[: int(limit_opt)]
-
-if not data:
-    st.info("Ingen shots endnu – gem et shot for at se historik.")
-else:
-    if view == "Tabel":
-        df = pd.DataFrame(data)
-        st.dataframe(df, use_container_width=True, hide_index=True)
-    else:
-        # Kortvisning – mobilvenlig
-        for r in data:
-            st.markdown(
-                f"""
-                <div style='border:1px solid #e5e7eb;border-radius:12px;padding:12px;margin-bottom:8px'>
-                  <div style='display:flex;justify-content:space-between;gap:12px;'>
-                    <b>{r.get('Dato','')}</b>
-                    <span>{r.get('Type','')} • kværn {r.get('Kværn','')}</span>
-                  </div>
-                  <div style='margin-top:6px;display:flex;flex-wrap:wrap;gap:12px;'>
-                    <span>Ind: <b>{r.get('Dosis (g)','')}</b> g</span>
-                    <span>Ud: <b>{r.get('Udbytte (g)','')}</b> g</span>
-                    <span>Tid: <b>{r.get('Tid (sek)','')}</b> s</span>
-                    <span>Ratio: <b>{r.get('Faktisk ratio','')}</b></span>
-                  </div>
-                  <div style='margin-top:6px;'>
-                    <i>{r.get('Anbefaling','')}</i>
-                  </div>
-                  {('<div style="margin-top:6px;color:#374151;">📝 ' + r.get('Noter','') + '</div>') if r.get('Noter') else ''}
-                </div>
-                """,
-                unsafe_allow_html=True,
-            )
+@fragment
+def history(bean_id: str, bean: dict):
+    """Historik. Skift af visning/antal kører kun dette fragment, og der
+    hentes kun så mange shots fra lageret som "Antal viste" kræver."""
+    with perf.timer("render.history"):
+        st.subheader("Historik for valgt bønne")
+
+        # Kontrolleret visning til mobil: kort eller tabel
+        if hasattr(st, 'segmented_control'):
+            view = st.segmented_control("Visning", options=["Kort", "Tabel"], default="Kort")
+        else:
+            view = st.radio("Visning", ["Kort","Tabel"], horizontal=True)
+        limit_opt = st.selectbox("Antal viste", [5,10,25,50,"Alle"], index=1)
+
+        # Nyeste først (nye shots indsættes i toppen)
+        n = None if limit_opt == "Alle" else int(limit_opt)
+        shots = ensure_history(bean_id, bean, n)
+        shown = len(shots) if n is None else min(n, len(shots))
+        total = bean.get("entries_total", len(shots)) + bean.get("archived_total", 0)
+        if shown and total > shown:
+            st.caption(f"Viser {shown} af {total} shots.")
+
+        if not shown:
+            st.info("Ingen shots endnu – gem et shot for at se historik.")
+        else:
+            if view == "Tabel":
+                pandas()  # importtiden måles for sig
+                with perf.timer("render.history_dataframe"):
+                    df = shots.to_frame(shown)
+                config = {}
+                if hasattr(st, "column_config"):
+                    config["Dato"] = st.column_config.DateColumn("Dato", format="YYYY-MM-DD")
+                with perf.timer("render.history_table"):
+                    st.dataframe(df, use_container_width=True, hide_index=True, column_config=config)
+            else:
+                # Kortvisning – mobilvenlig
+                with perf.timer("render.history_cards"):
+                    for r in shots.rows(shown):
+                        st.markdown(
+                            f"""
+                            <div style='border:1px solid #e5e7eb;border-radius:12px;padding:12px;margin-bottom:8px'>
+                              <div style='display:flex;justify-content:space-between;gap:12px;'>
+                                <b>{r.get('Dato','')}</b>
+                                <span>{r.get('Type','')} • kværn {r.get('Kværn','')}</span>
+                              </div>
+                              <div style='margin-top:6px;display:flex;flex-wrap:wrap;gap:12px;'>
+                                <span>Ind: <b>{r.get('Dosis (g)','')}</b> g</span>
+                                <span>Ud: <b>{r.get('Udbytte (g)','')}</b> g</span>
+                                <span>Tid: <b>{r.get('Tid (sek)','')}</b> s</span>
+                                <span>Ratio: <b>{r.get('Faktisk ratio','')}</b></span>
+                              </div>
+                              <div style='margin-top:6px;'>
+                                <i>{r.get('Anbefaling','')}</i>
+                              </div>
+                              {('<div style="margin-top:6px;color:#374151;">📝 ' + r.get('Noter','') + '</div>') if r.get('Noter') else ''}
+                            </div>
+                            """,
+                            unsafe_allow_html=True,
+                        )
+
+history(bean_id, bean)
 
 st.caption("Simpel version: login → vælg/opret bønne → log shot → se historik. Ratio sweet spot 1.8–2.2 og 25–30 sek.")
+perf.record("render.run", time.perf_counter() - RUN_T0)
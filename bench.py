@@ -0,0 +1,323 @@
+"""Benchmarks af lagerlaget mod et falsk Google Sheet (ingen netværk).
+
+    python bench.py                          # 100, 1.000 og 10.000 shots
+    python bench.py --rows 100 1000000 --latency 0.2 --fail-rate 0.05
+    python bench.py --save-baseline          # gem som bench_baseline.json
+    python bench.py --baseline bench_baseline.json   # sammenlign (exit 1 ved regression)
+
+Hvert scenarie køres pr. backend og rækkeantal mod `fakesheets` gennem den
+samme `SheetsGateway` som appen (retry ved 429). Der rapporteres vægtid,
+API-kald (i alt og pr. metode), afviste kald og peak-hukommelse (tracemalloc).
+Scenarierne er lagerets API-kald plus appens login- og gem-shot-forløb, og
+"workers": flere serverprocesser mod samme ark (med/uden delt disk-cache),
+og "compact": arkivering mens en anden proces læser.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from fakesheets import FakeSpreadsheet
+from gateway import GatedWorksheet, SheetsGateway
+from storage import (
+    BEANS_HEADER, ENTRIES_HEADER, IncrementalSheetsStorage, SharedCache, SheetsStorage,
+    WriteBehindStorage,
+)
+
+BEANS_PER_USER = 3
+SHOTS_PER_BEAN = 20
+DEFAULT_ROWS = [100, 1000, 10000]
+DEFAULT_BASELINE = "bench_baseline.json"
+WORKERS = 4  # serverprocesser i "workers"-scenariet
+
+ENTRY = {
+    "Dato": "2026-01-01", "Type": "Double", "Kværn": "8", "Dosis (g)": 18.0,
+    "Udbytte (g)": 36.0, "Tid (sek)": 27.0, "Target ratio": 2.0, "Mål ud (g)": 36,
+    "Faktisk ratio": 2.0, "Anbefaling": "✅ God ekstraktion – behold indstillingerne.",
+    "Noter": "",
+}
+
+# Sådan læses ENTRY tilbage fra arket (tal som tal)
+ENTRY_AS_READ = dict(ENTRY, **{"Kværn": 8, "Mål ud (g)": 36, "Faktisk ratio": 2})
+
+
+# --------------------------- Testdata --------------------------------------
+def build_sheet(n_entries: int, args) -> tuple:
+    """Et falsk ark med `n_entries` shots fordelt på brugere/bønner.
+
+    Shots flettes på tværs af bønner (som når mange brugere logger samtidig).
+    Cellerne deles mellem rækkerne, så 1M rækker kan ligge i hukommelsen.
+    """
+    sh = FakeSpreadsheet(latency=args.latency, per_cell=args.per_cell,
+                         fail_rate=args.fail_rate, seed=args.seed)
+    n_beans = max(1, math.ceil(n_entries / SHOTS_PER_BEAN))
+    n_users = max(1, math.ceil(n_beans / BEANS_PER_USER))
+    keys = [(f"user{i // BEANS_PER_USER:05d}", f"bean-{i % BEANS_PER_USER}") for i in range(n_beans)]
+    beans = [list(BEANS_HEADER)] + [[u, b, "Risteri", b, "Washed", 2] for u, b in keys]
+    tail = ("2026-01-01", "Double", 8, 18, 36, 27, 2, 36, 2, ENTRY["Anbefaling"], "")
+    entries = [list(ENTRIES_HEADER)] + [keys[i % n_beans] + tail for i in range(n_entries)]
+    sh.create("beans", beans)
+    sh.create("entries", entries)
+    users = sorted({u for u, _ in keys})
+    assert len(users) == n_users
+    return sh, keys, users
+
+
+def make_store(backend: str, sh: FakeSpreadsheet, args, cache_path: str = None):
+    gw = SheetsGateway(per_minute=args.per_minute, burst=max(10.0, args.per_minute / 60),
+                       max_retries=10, base_delay=args.backoff, max_delay=args.backoff * 16)
+    ws_beans = GatedWorksheet(sh._sheets["beans"], gw)
+    ws_entries = GatedWorksheet(sh._sheets["entries"], gw)
+    if backend == "sheets":
+        store = SheetsStorage(ws_beans, ws_entries)
+    elif backend == "sheets-incremental":
+        store = IncrementalSheetsStorage(ws_beans, ws_entries, spreadsheet=sh)
+    elif backend == "sheets-shared":
+        # Som en serverproces med den delte disk-cache (samme fil for alle)
+        store = IncrementalSheetsStorage(ws_beans, ws_entries, spreadsheet=sh,
+                                         shared=SharedCache(cache_path, source=sh.id))
+    elif backend == "write-behind":
+        store = WriteBehindStorage(IncrementalSheetsStorage(ws_beans, ws_entries, spreadsheet=sh),
+                                   flush_delay=0.0)
+    else:
+        raise ValueError(f"Ukendt backend: {backend}")
+    return store, gw
+
+
+def settle(store):
+    """Vent på en evt. write-behind-kø, så dens kald tælles med."""
+    if hasattr(store, "flush"):
+        store.flush()
+
+
+# --------------------------- Scenarier -------------------------------------
+# Hvert scenarie får (store, keys, users, rng, ops, new_store) og kører `ops`
+# gange; `new_store()` giver endnu en "serverproces" mod samme ark (og samme
+# delte cache). "cold" scenarier får et nyt lager; de andre et varmt.
+
+def sc_login(store, keys, users, rng, ops, new_store):
+    # Appens login: brugerliste → bønner uden shots → seneste 10 for én bønne
+    uid = rng.choice(users)
+    store.list_user_ids()
+    beans = store.load_user_data(uid, entries_limit=0)
+    for bid in list(beans)[:1]:
+        store.count_entries(uid, bid)
+        store.load_entries(uid, bid, limit=10)
+
+
+def sc_load_user_data(store, keys, users, rng, ops, new_store):
+    for _ in range(ops):
+        store.load_user_data(rng.choice(users))
+
+
+def sc_list_user_ids(store, keys, users, rng, ops, new_store):
+    for _ in range(ops):
+        store.list_user_ids()
+
+
+def sc_upsert_bean(store, keys, users, rng, ops, new_store):
+    # Halvdelen uændret (som ved hvert gemt shot), halvdelen med ny ratio
+    for i in range(ops):
+        uid, bid = rng.choice(keys)
+        ratio = 2 if i % 2 else 2.1
+        store.upsert_bean(uid, bid, {"brand": "Risteri", "name": bid, "process": "Washed",
+                                     "target_ratio": ratio})
+    settle(store)
+
+
+def sc_append_entry(store, keys, users, rng, ops, new_store):
+    for _ in range(ops):
+        uid, bid = rng.choice(keys)
+        store.append_entry(uid, bid, ENTRY)
+    settle(store)
+
+
+def sc_shot_save(store, keys, users, rng, ops, new_store):
+    # Appens gem-shot: upsert (uændret) + append, derefter rerun med historik
+    for _ in range(ops):
+        uid, bid = rng.choice(keys)
+        store.upsert_bean(uid, bid, {"brand": "Risteri", "name": bid, "process": "Washed",
+                                     "target_ratio": 2})
+        store.append_entry(uid, bid, ENTRY)
+        store.count_entries(uid, bid)
+        store.load_entries(uid, bid, limit=10)
+    settle(store)
+
+
+def sc_workers(store, keys, users, rng, ops, new_store):
+    # Koldstart af flere processer, og derefter et gemt shot i én af dem som
+    # de andre skal se (ved næste synk, efter synk-intervallet)
+    workers = [store] + [new_store() for _ in range(WORKERS - 1)]
+    for w in workers:
+        sc_login(w, keys, users, rng, ops, new_store)
+    uid, bid = rng.choice(keys)
+    before = [w.count_entries(uid, bid) for w in workers]
+    workers[0].append_entry(uid, bid, ENTRY)
+    settle(workers[0])
+    for i, w in enumerate(workers):
+        # Uden delt cache ses skrivningen først ved næste synk mod arket.
+        # (write-behind: intervallet sidder på det indre lager)
+        inner = getattr(w, "inner", w)
+        if hasattr(inner, "min_sync_interval") and getattr(inner, "shared", None) is None:
+            inner.min_sync_interval = 0.0
+        if w.count_entries(uid, bid) != before[i] + 1 \
+                or w.load_entries(uid, bid, limit=1) != [ENTRY_AS_READ]:
+            raise RuntimeError(f"workers: proces {i} ser ikke det gemte shot")
+
+
+def sc_compact(store, keys, users, rng, ops, new_store):
+    # Arkivering mens en anden proces læser med et snapshot fra før
+    if not hasattr(store, "compact"):
+        return  # fuld-scan-backenden har intet arkiv
+    reader = new_store()
+    reader.list_user_ids()
+    key = rng.choice(keys)
+    total = store.count_entries(*key)
+    store.compact(keep_per_bean=5, settle=0)
+    for _ in range(ops):
+        uid, bid = rng.choice(keys)
+        hot = reader.load_entries(uid, bid)
+        if len(hot) > 5 or hot != store.load_entries(uid, bid):
+            raise RuntimeError("compact: læseren så flyttede rækker")
+    if reader.count_entries(*key) + reader.count_archived(*key) != total:
+        raise RuntimeError("compact: shots mangler efter arkivering")
+
+
+SCENARIOS = {
+    "login": (sc_login, True),
+    "load_user_data": (sc_load_user_data, False),
+    "list_user_ids": (sc_list_user_ids, False),
+    "upsert_bean": (sc_upsert_bean, False),
+    "append_entry": (sc_append_entry, False),
+    "shot_save": (sc_shot_save, False),
+    "workers": (sc_workers, True),
+    "compact": (sc_compact, False),
+}
+BACKENDS = ["sheets", "sheets-incremental", "sheets-shared", "write-behind"]
+
+
+def run_one(scenario: str, backend: str, rows: int, args) -> dict:
+    fn, cold = SCENARIOS[scenario]
+    sh, keys, users = build_sheet(rows, args)
+    rng = random.Random(args.seed)
+    cache_dir = tempfile.TemporaryDirectory()
+    cache_path = os.path.join(cache_dir.name, "cache.sqlite")
+    store, gw = make_store(backend, sh, args, cache_path)
+    new_store = lambda: make_store(backend, sh, args, cache_path)[0]  # noqa: E731
+    if not cold:
+        store.list_user_ids()  # fyld caches/snapshot før målingen
+        settle(store)
+    sh.reset_counters()
+    gw.retries = 0
+    if args.memory:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    fn(store, keys, users, rng, args.ops, new_store)
+    wall = time.perf_counter() - t0
+    peak = 0
+    if args.memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    cache_dir.cleanup()
+    return {
+        "scenario": scenario,
+        "backend": backend,
+        "rows": rows,
+        "wall_s": round(wall, 4),
+        "calls": sum(sh.calls.values()),
+        "calls_by_method": dict(sorted(sh.calls.items())),
+        "rejected_429": sh.failures,
+        "retries": gw.retries,
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+# --------------------------- Baseline --------------------------------------
+def _key(r: dict) -> tuple:
+    return r["scenario"], r["backend"], r["rows"]
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """Tilføj sammenligning med baseline; returnér listen af regressioner."""
+    base = {_key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = base.get(_key(r))
+        if b is None:
+            r["vs_baseline"] = "ny"
+            continue
+        ratio = r["wall_s"] / b["wall_s"] if b["wall_s"] else 1.0
+        r["vs_baseline"] = f"{ratio:.2f}x tid, {r['calls'] - b['calls']:+d} kald"
+        if ratio > 1 + tolerance or r["calls"] > b["calls"]:
+            regressions.append(r)
+    return regressions
+
+
+def print_table(results: list):
+    cols = ["scenario", "backend", "rows", "wall_s", "calls", "rejected_429", "retries", "peak_kb"]
+    if any("vs_baseline" in r for r in results):
+        cols.append("vs_baseline")
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in results)) for c in cols}
+    print("  ".join(c.ljust(widths[c]) for c in cols))
+    for r in results:
+        print("  ".join(str(r.get(c, "")).ljust(widths[c]) for c in cols))
+
+
+def main(argv=None) -> int:
+    p = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    p.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS,
+                   help="antal shots i arket (fx 100 1000 1000000)")
+    p.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    p.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    p.add_argument("--ops", type=int, default=20, help="kald pr. scenarie")
+    p.add_argument("--latency", type=float, default=0.0, help="sek. pr. API-kald")
+    p.add_argument("--per-cell", type=float, default=0.0, help="ekstra sek. pr. celle i svaret")
+    p.add_argument("--fail-rate", type=float, default=0.0, help="andel af kald afvist med 429")
+    p.add_argument("--per-minute", type=float, default=1e9,
+                   help="gatewayens kvote (default: ubegrænset)")
+    p.add_argument("--backoff", type=float, default=0.01, help="gatewayens base-backoff i sek.")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--no-memory", dest="memory", action="store_false",
+                   help="uden tracemalloc (hurtigere ved store ark)")
+    p.add_argument("--json", help="skriv resultaterne som JSON hertil")
+    p.add_argument("--baseline", help="sammenlign med denne baseline")
+    p.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE,
+                   help=f"gem resultaterne som baseline (default {DEFAULT_BASELINE})")
+    p.add_argument("--tolerance", type=float, default=0.25,
+                   help="tilladt ekstra vægtid før det er en regression (0.25 = 25%%)")
+    args = p.parse_args(argv)
+
+    results = []
+    for rows in args.rows:
+        for scenario in args.scenarios:
+            for backend in args.backends:
+                results.append(run_one(scenario, backend, rows, args))
+                print(f"  {scenario} / {backend} / {rows}: {results[-1]['wall_s']} s",
+                      file=sys.stderr)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+    print_table(results)
+
+    meta = {k: getattr(args, k) for k in ("ops", "latency", "per_cell", "fail_rate", "per_minute", "seed")}
+    for path in filter(None, [args.json, args.save_baseline]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"settings": meta, "results": results}, f, indent=2, ensure_ascii=False)
+    if regressions:
+        print(f"\n{len(regressions)} regression(er) i forhold til {args.baseline}:", file=sys.stderr)
+        for r in regressions:
+            print(f"  {r['scenario']} / {r['backend']} / {r['rows']}: {r['vs_baseline']}",
+                  file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+"""Bulk-import og -eksport af bønner og shots (CSV og Parquet).
+
+Filformatet er én række pr. shot med bønnens felter på hver række
+(`EXPORT_HEADER`); en bønne uden shots er en række med tomme shot-felter.
+Ved import accepteres også de danske kolonnenavne ("Dato", "Dosis (g)" …).
+
+Begge veje streames i bidder på `CHUNK` rækker:
+- import: hver bid valideres (parse_float/slugify som i appen), ratio, mål
+  og anbefaling udledes vektoriseret, og bidden skrives med ét
+  `write_batch` (→ `append_rows` i Sheets) direkte til backenden
+- eksport: bønne for bønne via `Storage.iter_entries`, så der aldrig er mere
+  end en bid shots i hukommelsen
+
+Parquet kræver pyarrow (valgfri afhængighed, importeres ved behov).
+Modulet importerer ikke streamlit.
+"""
+import csv
+import datetime
+import io
+
+from analytics import rec_dose, recommend_batch
+from shots import EPOCH, NAT, fmt_num, parse_day, parse_float, slugify
+from storage import ENTRY_FIELDS
+
+CHUNK = 500
+MAX_ERRORS = 100  # fejlbeskeder der gemmes (resten tælles bare)
+
+BEAN_COLS = ["user_id", "bean_id", "brand", "name", "process", "bean_target_ratio"]
+SHOT_COLS = [c for c, _ in ENTRY_FIELDS]
+EXPORT_HEADER = BEAN_COLS + SHOT_COLS
+NUMERIC_COLS = {"bean_target_ratio", "dose", "yield", "time", "target_ratio", "target_out", "ratio"}
+# Felter der afgør om en række har et shot (resten udledes)
+SHOT_INPUT = ("date", "type", "grind", "dose", "yield", "time", "notes")
+
+BEAN_FIELDS = ("brand", "name", "process", "target_ratio")
+NEW_BEAN = {"brand": "", "name": "", "process": "", "target_ratio": 2.0}
+
+# Danske visningsnavne → kolonnenavne
+ALIASES = {label.lower(): col for col, label in ENTRY_FIELDS}
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.beans = 0
+        self.shots = 0
+        self.rejected = 0
+        self.errors: list = []  # (linje, besked), højst MAX_ERRORS
+
+    def reject(self, line: int, msg: str):
+        self.rejected += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, msg))
+
+
+def _fmt(fmt: str) -> str:
+    fmt = (fmt or "csv").lower().lstrip(".")
+    if fmt not in ("csv", "parquet"):
+        raise ValueError(f"Ukendt format: {fmt} (brug csv eller parquet)")
+    return fmt
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise ImportError("Parquet kræver pakken pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+# --------------------------- Læsning ---------------------------------------
+def read_chunks(fp, fmt: str = "csv", chunk: int = CHUNK):
+    """Rækker (dicts med normaliserede kolonnenavne) fra en binær fil, i bidder."""
+    if _fmt(fmt) == "parquet":
+        pq = _pyarrow().parquet
+        for batch in pq.ParquetFile(fp).iter_batches(batch_size=chunk):
+            yield [_normalise(r) for r in batch.to_pylist()]
+        return
+    text = io.TextIOWrapper(fp, encoding="utf-8-sig", newline="")
+    try:
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        part = []
+        for row in csv.DictReader(text, dialect=dialect):
+            part.append(_normalise(row))
+            if len(part) >= chunk:
+                yield part
+                part = []
+        if part:
+            yield part
+    finally:
+        text.detach()  # luk ikke kaldets fil
+
+
+def _normalise(row: dict) -> dict:
+    out = {}
+    for k, v in row.items():
+        if k is None:
+            continue
+        k = str(k).strip()
+        out[ALIASES.get(k.lower(), k.lower())] = v
+    return out
+
+
+# --------------------------- Import ----------------------------------------
+def _text(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, float):
+        return fmt_num(v)
+    return str(v).strip()
+
+
+def _validate(row: dict, user_id):
+    """→ (nøgle, bønnefelter, shot-dict eller None); ValueError ved ugyldig række.
+
+    Bønnefelterne er kun dem filen faktisk udfylder, så en fil med bare
+    `bean_id` og shots ikke overskriver en eksisterende bønne. Shottets
+    target ratio er None, hvis hverken shot- eller bønnekolonnen har en.
+    """
+    uid = user_id or _text(row.get("user_id"))
+    if not uid:
+        raise ValueError("mangler user_id")
+    brand, name = _text(row.get("brand")), _text(row.get("name"))
+    bid = _text(row.get("bean_id"))
+    if not (bid or brand or name):
+        raise ValueError("mangler bean_id eller mærke/navn")
+    bid = slugify(bid or f"{brand}-{name}")
+
+    tr = row.get("bean_target_ratio")
+    if _text(tr) == "":
+        tr = row.get("target_ratio")
+    tr = parse_float(tr) if _text(tr) != "" else None
+    if tr is not None and not 0 < tr < 10:
+        raise ValueError("ugyldig target ratio")
+    bean = {"brand": brand, "name": name, "process": _text(row.get("process")), "target_ratio": tr}
+    bean = {k: v for k, v in bean.items() if v not in ("", None)}
+
+    if all(_text(row.get(c)) == "" for c in SHOT_INPUT):
+        return (uid, bid), bean, None
+    day = parse_day(row.get("date"))
+    if day == NAT:
+        raise ValueError(f"ugyldig dato: {_text(row.get('date'))!r}")
+    shot = {"date": row.get("date"), "type": _text(row.get("type")) or "Double",
+            "grind": _text(row.get("grind")), "notes": _text(row.get("notes")),
+            "target_ratio": tr}  # None → bønnens, se import_file
+    shot_tr = _text(row.get("target_ratio"))
+    if shot_tr:
+        shot["target_ratio"] = parse_float(shot_tr)
+        if shot["target_ratio"] is None:
+            raise ValueError("ugyldig target ratio")
+    for c in ("dose", "yield", "time"):
+        raw = _text(row.get(c))
+        v = parse_float(raw) if raw else None
+        if raw and (v is None or v < 0):
+            raise ValueError(f"ugyldig værdi i {c}: {raw!r}")
+        shot[c] = v
+    return (uid, bid), bean, shot
+
+
+def _entries(shots: list) -> list:
+    """Shot-felter → app-entries; ratio, mål og anbefaling udledes samlet."""
+    import numpy as np
+
+    nan = float("nan")
+    dose = np.array([s["dose"] if s["dose"] is not None else nan for s in shots])
+    out_g = np.array([s["yield"] if s["yield"] is not None else nan for s in shots])
+    time_s = np.array([s["time"] if s["time"] is not None else nan for s in shots])
+    tr = np.array([s["target_ratio"] for s in shots], dtype=np.float64)
+    base = np.array([rec_dose(s["type"]) or 0.0 for s in shots])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = np.where((dose > 0) & (out_g > 0), out_g / dose, nan)
+    target = np.where(np.isnan(dose), base, dose) * tr
+    advice, _ = recommend_batch(ratio, time_s, target)
+
+    entries = []
+    for i, s in enumerate(shots):
+        day = EPOCH + datetime.timedelta(days=parse_day(s["date"]))
+        r, t = float(ratio[i]), float(target[i])
+        entries.append({
+            "Dato": day.isoformat(),
+            "Type": s["type"],
+            "Kværn": s["grind"],
+            "Dosis (g)": s["dose"] if s["dose"] is not None else "",
+            "Udbytte (g)": s["yield"] if s["yield"] is not None else "",
+            "Tid (sek)": s["time"] if s["time"] is not None else "",
+            "Target ratio": s["target_ratio"],
+            "Mål ud (g)": int(round(t)) if t == t and t else "",
+            "Faktisk ratio": round(r, 2) if r == r and r else "",
+            "Anbefaling": advice[i],
+            "Noter": s["notes"],
+        })
+    return entries
+
+
+def import_file(store, fp, fmt: str = "csv", user_id: str = None,
+                chunk: int = CHUNK, progress=None) -> ImportResult:
+    """Importér en fil bid for bid. Ugyldige rækker springes over og noteres.
+
+    `user_id` tvinger alle rækker ind under én bruger (ellers bruges filens
+    kolonne). Findes bønnen allerede, flettes kun filens udfyldte felter ind
+    (og intet skrives, hvis de ikke ændrer noget). Bidderne skrives direkte
+    til backenden – uden om en evt. write-behind-kø, så et stort import ikke
+    journaliseres række for række.
+    `progress(result)` kaldes efter hver skrevet bid.
+    """
+    target = getattr(store, "inner", store)
+    result = ImportResult()
+    known = {}     # user_id → {bean_id: stamdata} (lagerets + det importerede)
+    seen = set()   # (user_id, bean_id) der allerede er behandlet
+    line = 1      # header
+    for rows in read_chunks(fp, fmt, chunk):
+        beans, keys, shots = {}, [], []
+        for row in rows:
+            line += 1
+            result.rows += 1
+            try:
+                key, bean, shot = _validate(row, user_id)
+            except ValueError as e:
+                result.reject(line, str(e))
+                continue
+            if key[0] not in known:
+                known[key[0]] = {bid: {k: b.get(k) for k in BEAN_FIELDS}
+                                 for bid, b in store.load_user_data(key[0], entries_limit=0).items()}
+            have = known[key[0]]
+            if key not in seen:
+                seen.add(key)
+                old = have.get(key[1])
+                merged = {**(old or NEW_BEAN), **bean}
+                if merged != old:
+                    beans[key] = merged
+                have[key[1]] = merged
+            if shot is not None:
+                if shot["target_ratio"] is None:
+                    shot["target_ratio"] = parse_float(have[key[1]].get("target_ratio")) or 2.0
+                keys.append(key)
+                shots.append(shot)
+        entries = [(k[0], k[1], e) for k, e in zip(keys, _entries(shots))] if shots else []
+        if beans or entries:
+            target.write_batch(beans, entries)
+        result.beans += len(beans)
+        result.shots += len(entries)
+        if progress is not None:
+            progress(result)
+    return result
+
+
+# --------------------------- Eksport ---------------------------------------
+def export_rows(store, user_id: str = None, chunk: int = CHUNK):
+    """Eksport-rækker (lister i `EXPORT_HEADER`-rækkefølge) i bidder.
+
+    Uden `user_id` eksporteres hele deploymentet. Shots kommer ældste først
+    pr. bønne, så en eksport kan importeres igen i samme rækkefølge.
+    """
+    if hasattr(store, "flush"):
+        store.flush()
+    users = [user_id] if user_id else store.list_user_ids()
+    for uid in users:
+        for bid, bean in store.load_user_data(uid, entries_limit=0).items():
+            head = [uid, bid, bean.get("brand", ""), bean.get("name", ""),
+                    bean.get("process", ""), bean.get("target_ratio", 2.0)]
+            empty = True
+            for part in store.iter_entries(uid, bid, chunk):
+                if part:
+                    empty = False
+                    yield [head + [e.get(label, "") for _, label in ENTRY_FIELDS] for e in part]
+            if empty:
+                yield [head + [""] * len(SHOT_COLS)]
+
+
+def export_file(store, fp, fmt: str = "csv", user_id: str = None, chunk: int = CHUNK) -> int:
+    """Skriv eksporten til en binær fil. Returnerer antal rækker."""
+    n = 0
+    if _fmt(fmt) == "parquet":
+        pa = _pyarrow()
+        schema = pa.schema([
+            (c, pa.float64() if c in NUMERIC_COLS else pa.string()) for c in EXPORT_HEADER
+        ])
+        buf = []
+        with pa.parquet.ParquetWriter(fp, schema) as writer:
+            for rows in export_rows(store, user_id, chunk):
+                buf.extend(rows)
+                if len(buf) >= chunk:
+                    writer.write_table(_table(pa, schema, buf))
+                    n += len(buf)
+                    buf = []
+            if buf or not n:
+                writer.write_table(_table(pa, schema, buf))
+                n += len(buf)
+        return n
+    text = io.TextIOWrapper(fp, encoding="utf-8", newline="")
+    try:
+        w = csv.writer(text)
+        w.writerow(EXPORT_HEADER)
+        for rows in export_rows(store, user_id, chunk):
+            w.writerows(rows)
+            n += len(rows)
+    finally:
+        text.flush()
+        text.detach()
+    return n
+
+
+def _table(pa, schema, rows: list):
+    cols = {}
+    for i, c in enumerate(EXPORT_HEADER):
+        if c in NUMERIC_COLS:
+            cols[c] = [parse_float(r[i]) for r in rows]
+        else:
+            cols[c] = [_text(r[i]) for r in rows]
+    return pa.Table.from_pydict(cols, schema=schema)
@@ -0,0 +1,228 @@
+"""In-memory stand-in for gspread's `Spreadsheet`/`Worksheet` (til bench.py).
+
+Dækker de kald lagerlaget og appen bruger (get, batch_get, get_all_values,
+get_all_records, row_values, append_row(s), update, batch_update,
+worksheet(s), add_worksheet og spreadsheet-niveauets batch_update med
+deleteDimension/updateCells) med gspreads svarformer: tomme celler i enden
+af en række skæres af, `get_all_values` giver tekst, og UNFORMATTED_VALUE
+giver tal som tal.
+
+Hvert kald kan forsinkes (`latency` + `per_cell` pr. returneret celle) og
+afvises med 429 (`fail_rate`, seedet så kørsler kan gentages). Kaldene
+tælles pr. metode i `FakeSpreadsheet.calls`.
+"""
+import collections
+import random
+import re
+import threading
+import time
+
+from storage import col_letter, numericise
+
+_A1 = re.compile(r"^([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?$")
+
+
+class FakeResponse:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+
+
+class FakeAPIError(Exception):
+    """Som gspread.exceptions.APIError: status på `.response.status_code`."""
+
+    def __init__(self, status_code: int = 429):
+        super().__init__(f"{status_code}: Quota exceeded (fake)")
+        self.response = FakeResponse(status_code)
+
+
+class FakeWorksheetNotFound(Exception):
+    pass
+
+
+def col_number(letters: str) -> int:
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+
+def parse_a1(rng: str) -> tuple:
+    """"A2:F" → (første række, sidste række eller None, første kol, sidste kol)."""
+    rng = rng.split("!")[-1].replace("$", "")
+    rows = re.match(r"^(\d+):(\d+)$", rng)  # hele rækker, fx "1:1"
+    if rows:
+        return int(rows.group(1)), int(rows.group(2)), 1, 10 ** 6
+    m = _A1.match(rng)
+    if not m:
+        raise ValueError(f"Ugyldigt A1-område: {rng}")
+    c1, r1, c2, r2 = m.groups()
+    first_row = int(r1) if r1 else 1
+    last_row = int(r2) if r2 else (None if c2 is not None else first_row if r1 else None)
+    return first_row, last_row, col_number(c1), col_number(c2 or c1)
+
+
+def _trim(row: list) -> list:
+    end = len(row)
+    while end and row[end - 1] in ("", None):
+        end -= 1
+    return list(row[:end])
+
+
+class FakeSpreadsheet:
+    def __init__(self, title: str = "Kaffe (fake)", latency: float = 0.0, per_cell: float = 0.0,
+                 fail_rate: float = 0.0, seed: int = 0):
+        self.title = title
+        self.id = "fake-" + title
+        self.latency = latency
+        self.per_cell = per_cell
+        self.fail_rate = fail_rate
+        self.calls = collections.Counter()
+        self.failures = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sheets: dict = {}
+
+    # ---- gspread-API ----
+    def worksheet(self, name: str):
+        self._call("worksheet")
+        if name not in self._sheets:
+            raise FakeWorksheetNotFound(name)
+        return self._sheets[name]
+
+    def worksheets(self):
+        self._call("worksheets")
+        return list(self._sheets.values())
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 26):
+        self._call("add_worksheet")
+        return self.create(title)
+
+    def batch_update(self, body: dict):
+        """Spreadsheet-niveau: deleteDimension (rækker) og updateCells (tekst)."""
+        self._call("spreadsheet_batch_update")
+        by_id = {w.id: w for w in self._sheets.values()}
+        for req in body.get("requests", []):
+            if "deleteDimension" in req:
+                rng = req["deleteDimension"]["range"]
+                ws = by_id[rng["sheetId"]]
+                with ws._lock:
+                    del ws.rows[rng["startIndex"]:rng["endIndex"]]
+            elif "updateCells" in req:
+                upd = req["updateCells"]
+                ws, start = by_id[upd["start"]["sheetId"]], upd["start"]
+                values = [[c["userEnteredValue"]["stringValue"] for c in row["values"]]
+                          for row in upd["rows"]]
+                ws._write(f"{col_letter(start['columnIndex'] + 1)}{start['rowIndex'] + 1}", values)
+        return {}
+
+    # ---- til opsætning (tælles ikke) ----
+    def create(self, title: str, rows: list = None):
+        ws = self._sheets[title] = FakeWorksheet(self, title, len(self._sheets), rows or [])
+        return ws
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls.clear()
+            self.failures = 0
+
+    def _call(self, method: str, cells: int = 0):
+        """Tæl, forsink og evt. afvis et API-kald (før det udføres)."""
+        with self._lock:
+            self.calls[method] += 1
+            fail = self.fail_rate and self._rng.random() < self.fail_rate
+            if fail:
+                self.failures += 1
+        delay = self.latency + self.per_cell * cells
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise FakeAPIError(429)
+
+
+class FakeWorksheet:
+    def __init__(self, sheet: FakeSpreadsheet, title: str, sheet_id: int, rows: list):
+        self._sheet = sheet
+        self.title = title
+        self.id = sheet_id
+        self.rows = rows  # liste af lister/tupler med rå værdier (række 1 = header)
+        self._lock = threading.Lock()
+
+    def _read(self, first: int, last, c1: int, c2: int) -> list:
+        with self._lock:
+            block = self.rows[first - 1:last]
+        return [_trim(r[c1 - 1:c2]) for r in block]
+
+    def _cells(self, values: list) -> int:
+        return sum(len(r) for r in values)
+
+    # ---- læsning ----
+    def get(self, rng: str, value_render_option=None, **kwargs):
+        first, last, c1, c2 = parse_a1(rng)
+        values = self._read(first, last, c1, c2)
+        self._sheet._call("get", self._cells(values))
+        while values and not values[-1]:
+            values.pop()
+        return self._render(values, value_render_option)
+
+    def batch_get(self, ranges: list, value_render_option=None, **kwargs):
+        out = [self._read(*parse_a1(r)) for r in ranges]
+        self._sheet._call("batch_get", sum(self._cells(v) for v in out))
+        return [self._render(v, value_render_option) for v in out]
+
+    def get_all_values(self, **kwargs):
+        values = self._read(1, None, 1, 10 ** 6)
+        self._sheet._call("get_all_values", self._cells(values))
+        return self._render(values, None)
+
+    def get_all_records(self, **kwargs):
+        values = self._read(1, None, 1, 10 ** 6)
+        self._sheet._call("get_all_records", self._cells(values))
+        if not values:
+            return []
+        header = [str(h) for h in values[0]]
+        return [
+            {h: numericise(r[i] if i < len(r) else "") for i, h in enumerate(header)}
+            for r in values[1:]
+        ]
+
+    def row_values(self, row: int, **kwargs):
+        values = self._read(row, row, 1, 10 ** 6)
+        self._sheet._call("row_values", self._cells(values))
+        return self._render(values, None)[0] if values else []
+
+    @staticmethod
+    def _render(values: list, option) -> list:
+        if option == "UNFORMATTED_VALUE":
+            return values
+        return [["" if v is None else str(v) for v in r] for r in values]
+
+    # ---- skrivning ----
+    def append_row(self, values: list, **kwargs):
+        self._sheet._call("append_row", len(values))
+        with self._lock:
+            self.rows.append(list(values))
+
+    def append_rows(self, values: list, **kwargs):
+        self._sheet._call("append_rows", self._cells(values))
+        with self._lock:
+            self.rows.extend(list(v) for v in values)
+
+    def _write(self, rng: str, values: list):
+        first, _, c1, _ = parse_a1(rng)
+        with self._lock:
+            while len(self.rows) < first + len(values) - 1:
+                self.rows.append([])
+            for i, vals in enumerate(values):
+                row = list(self.rows[first - 1 + i])
+                row.extend([""] * (c1 - 1 + len(vals) - len(row)))
+                row[c1 - 1:c1 - 1 + len(vals)] = vals
+                self.rows[first - 1 + i] = row
+
+    def update(self, rng: str, values: list = None, **kwargs):
+        self._sheet._call("update", self._cells(values or []))
+        self._write(rng, values or [])
+
+    def batch_update(self, data: list, **kwargs):
+        self._sheet._call("batch_update", sum(self._cells(d["values"]) for d in data))
+        for d in data:
+            self._write(d["range"], d["values"])
@@ -0,0 +1,256 @@
+"""Fælles indgang for alle kald til Google Sheets.
+
+Alle sessioner i processen deler én `SheetsGateway`:
+- token bucket dimensioneret efter Sheets-kvoten (default 60 kald/min)
+- prioritets-baner: skrivninger og login-læsninger før almindelige
+  læsninger, og diagnose til sidst
+- retry med eksponentiel backoff + jitter på 429/5xx
+- identiske læsninger der allerede er i gang deles (coalescing)
+- valgfri `observer` der får hvert API-kalds tid, argumenter og svar
+
+`GatedSpreadsheet`/`GatedWorksheet` pakker gspread-objekterne ind, så resten
+af koden kan bruge dem som før. Modulet importerer hverken gspread eller
+streamlit.
+"""
+import contextlib
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+
+# Lavere tal = højere prioritet
+LANES = {"write": 0, "login": 1, "read": 2, "diag": 3}
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Aktuel bane. En ContextVar (ikke thread-local), så banen følger med når
+# læsninger køres parallelt i en kopi af kalderens context (storage.parallel)
+_LANE = contextvars.ContextVar("sheets_lane", default=None)
+
+WRITE_METHODS = {
+    "append_row", "append_rows", "update", "batch_update", "add_worksheet",
+    "resize", "clear", "delete_rows", "insert_rows",
+}
+
+
+def status_code(exc):
+    """HTTP-status fra en gspread APIError (eller None)."""
+    return getattr(getattr(exc, "response", None), "status_code", None)
+
+
+class TokenBucket:
+    """Klassisk token bucket: `rate` tokens/sek, højst `capacity` på lager."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> float:
+        """Tag et token. Returnerer 0 ved succes, ellers sekunder til næste."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Flight:
+    """Et igangværende læsekald som andre identiske kald kan vente på."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SheetsGateway:
+    def __init__(self, per_minute: float = 60.0, burst: float = 10.0,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 32.0,
+                 observer=None):
+        # observer(navn, sekunder, args, svar, ok) kaldes efter hvert API-kald
+        self.observer = observer
+        self.bucket = TokenBucket(per_minute / 60.0, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._waiting: list = []  # heap af (prioritet, nr)
+        self._counter = itertools.count()
+        self._flights: dict = {}
+        self._flights_lock = threading.Lock()
+        self.retries = 0
+
+    # ---- baner ----
+    @contextlib.contextmanager
+    def lane(self, name: str):
+        """Kør kald i blokken i en bestemt bane, fx `with gw.lane("diag"):`."""
+        token = _LANE.set(name)
+        try:
+            yield
+        finally:
+            _LANE.reset(token)
+
+    def current_lane(self, default: str) -> str:
+        lane = _LANE.get()
+        # En skrivning forbliver en skrivning, også inde i en diagnose-blok
+        if default == "write" or lane is None:
+            return default
+        return lane
+
+    # ---- rate limit ----
+    def _acquire(self, lane: str):
+        ticket = (LANES.get(lane, LANES["read"]), next(self._counter))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if self._waiting[0] == ticket:
+                        wait = self.bucket.try_take()
+                        if wait == 0:
+                            return
+                    else:
+                        wait = None
+                    self._cond.wait(wait)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    # ---- kald ----
+    def call(self, fn, *args, lane: str = "read", coalesce_key=None, **kwargs):
+        """Kald `fn(*args, **kwargs)` under rate limit og retry.
+
+        Er `coalesce_key` sat, og kører et kald med samme nøgle allerede,
+        ventes der på dets resultat i stedet for at lave et nyt.
+        """
+        if coalesce_key is None:
+            return self._call(fn, args, kwargs, lane)
+        with self._flights_lock:
+            flight = self._flights.get(coalesce_key)
+            owner = flight is None
+            if owner:
+                flight = self._flights[coalesce_key] = _Flight()
+        if not owner:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = self._call(fn, args, kwargs, lane)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                self._flights.pop(coalesce_key, None)
+            flight.done.set()
+
+    def _call(self, fn, args, kwargs, lane):
+        attempt = 0
+        while True:
+            self._acquire(lane)
+            t0 = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+                self._observe(fn, t0, args, result, True)
+                return result
+            except Exception as e:
+                self._observe(fn, t0, args, None, False)
+                if status_code(e) not in RETRY_STATUS or attempt >= self.max_retries:
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                attempt += 1
+                self.retries += 1
+                # "Full jitter", så ventende sessioner ikke rammer igen samtidig
+                time.sleep(random.uniform(0, delay))
+
+
+    def _observe(self, fn, t0, args, result, ok):
+        if self.observer is None:
+            return
+        try:
+            self.observer(getattr(fn, "__name__", "call"), time.perf_counter() - t0, args, result, ok)
+        except Exception:
+            pass  # måling må aldrig vælte et kald
+
+
+def _freeze(value):
+    """Lister/dicts → tupler, så argumenterne kan indgå i en coalesce-nøgle
+    (fx `batch_get`s liste af intervaller)."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+class GatedWorksheet:
+    """gspread-Worksheet hvor alle metodekald går gennem gatewayen."""
+
+    def __init__(self, ws, gateway: SheetsGateway):
+        self._ws = ws
+        self._gw = gateway
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        attr = getattr(self._ws, name)
+        if not callable(attr):
+            return attr
+        gw = self._gw
+
+        def gated(*args, **kwargs):
+            if name in WRITE_METHODS:
+                return gw.call(attr, *args, lane="write", **kwargs)
+            try:
+                key = (getattr(self._ws, "id", id(self._ws)), name,
+                       _freeze(args), _freeze(kwargs))
+                hash(key)
+            except TypeError:
+                key = None
+            return gw.call(attr, *args, lane=gw.current_lane("read"),
+                           coalesce_key=key, **kwargs)
+        return gated
+
+
+class GatedSpreadsheet:
+    """gspread-Spreadsheet via gatewayen; worksheets pakkes også ind."""
+
+    def __init__(self, sh, gateway: SheetsGateway):
+        self._sh = sh
+        self._gw = gateway
+
+    @property
+    def title(self):
+        return self._sh.title
+
+    def worksheet(self, name: str):
+        ws = self._gw.call(self._sh.worksheet, name, lane=self._gw.current_lane("read"))
+        return GatedWorksheet(ws, self._gw)
+
+    def worksheets(self):
+        wss = self._gw.call(self._sh.worksheets, lane=self._gw.current_lane("read"),
+                            coalesce_key=("worksheets", getattr(self._sh, "id", id(self._sh))))
+        return [GatedWorksheet(w, self._gw) for w in wss]
+
+    def add_worksheet(self, *args, **kwargs):
+        ws = self._gw.call(self._sh.add_worksheet, *args, lane="write", **kwargs)
+        return GatedWorksheet(ws, self._gw)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        attr = getattr(self._sh, name)
+        if not callable(attr):
+            return attr
+        lane = "write" if name in WRITE_METHODS else self._gw.current_lane("read")
+        return lambda *a, **kw: self._gw.call(attr, *a, lane=lane, **kw)
@@ -0,0 +1,143 @@
+"""Tidtagning og tællere for appens varme stier.
+
+To niveauer:
+- `PROCESS`: fælles for hele serverprocessen (alle sessioner + baggrundstråde)
+- en `Recorder` pr. Streamlit-session, bundet til kalderens context med
+  `bind_session` (følger med i læsninger der køres via storage.parallel)
+
+`timer("navn")` måler en blok; `record(...)` bruges af hooks der selv har
+målt (fx Sheets-gatewayen). Alt registreres både i processen og i den
+bundne session, hvis der er en.
+"""
+import collections
+import contextlib
+import contextvars
+import csv
+import io
+import json
+import threading
+import time
+
+SAMPLES = 1024  # seneste målinger pr. navn, bruges til percentiler
+
+
+class Stat:
+    __slots__ = ("count", "errors", "total", "nbytes", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.nbytes = 0
+        self.samples = collections.deque(maxlen=SAMPLES)
+
+    def add(self, seconds: float, nbytes: int = 0, ok: bool = True):
+        self.count += 1
+        self.total += seconds
+        self.nbytes += nbytes
+        self.samples.append(seconds)
+        if not ok:
+            self.errors += 1
+
+
+def percentile(xs: list, p: float) -> float:
+    """Percentil (nearest rank) af en sorteret liste."""
+    if not xs:
+        return 0.0
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats: dict[str, Stat] = {}
+        self.started = time.time()
+
+    def add(self, name: str, seconds: float, nbytes: int = 0, ok: bool = True):
+        with self._lock:
+            stat = self.stats.get(name)
+            if stat is None:
+                stat = self.stats[name] = Stat()
+            stat.add(seconds, nbytes, ok)
+
+    def rows(self) -> list:
+        """Én række pr. målt navn (tider i ms), sorteret efter samlet tid."""
+        with self._lock:
+            items = [(name, s, sorted(s.samples)) for name, s in self.stats.items()]
+        out = []
+        for name, s, xs in items:
+            out.append({
+                "navn": name,
+                "kald": s.count,
+                "fejl": s.errors,
+                "total_ms": round(s.total * 1000, 1),
+                "p50_ms": round(percentile(xs, 50) * 1000, 1),
+                "p95_ms": round(percentile(xs, 95) * 1000, 1),
+                "p99_ms": round(percentile(xs, 99) * 1000, 1),
+                "bytes": s.nbytes,
+            })
+        return sorted(out, key=lambda r: r["total_ms"], reverse=True)
+
+    def count(self, name: str) -> int:
+        with self._lock:
+            stat = self.stats.get(name)
+            return stat.count if stat else 0
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+            self.started = time.time()
+
+    def to_json(self) -> str:
+        return json.dumps({"started": self.started, "stats": self.rows()}, ensure_ascii=False, indent=2)
+
+    def to_csv(self) -> str:
+        rows = self.rows()
+        buf = io.StringIO()
+        fields = ["navn", "kald", "fejl", "total_ms", "p50_ms", "p95_ms", "p99_ms", "bytes"]
+        w = csv.DictWriter(buf, fieldnames=fields)
+        w.writeheader()
+        w.writerows(rows)
+        return buf.getvalue()
+
+
+PROCESS = Recorder()
+# En ContextVar (ikke thread-local), så kald fra læse-poolen tælles med i
+# sessionen der startede dem, ligesom gatewayens bane
+_SESSION = contextvars.ContextVar("perf_session", default=None)
+
+
+def bind_session(rec: Recorder):
+    """Bind en sessions-Recorder til den aktuelle context (kaldes ved hver rerun)."""
+    _SESSION.set(rec)
+
+
+def record(name: str, seconds: float, nbytes: int = 0, ok: bool = True):
+    PROCESS.add(name, seconds, nbytes, ok)
+    session = _SESSION.get()
+    if session is not None:
+        session.add(name, seconds, nbytes, ok)
+
+
+@contextlib.contextmanager
+def timer(name: str):
+    t0 = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except Exception:
+        ok = False
+        raise
+    finally:  # st.rerun()/st.stop() er BaseException og tæller ikke som fejl
+        record(name, time.perf_counter() - t0, ok=ok)
+
+
+def payload_size(value) -> int:
+    """Omtrentligt antal bytes i et Sheets-svar/-argument (tekst i cellerne)."""
+    if value is None:
+        return 0
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(v) for v in value)
+    if isinstance(value, dict):
+        return sum(payload_size(v) for v in value.values())
+    return len(str(value))
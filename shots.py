@@ -0,0 +1,187 @@
+"""Kompakt, kolonneopdelt lager af shots for én bønne (i session state).
+
+I stedet for én dict med danske nøgler pr. shot holdes hver kolonne som et
+typet array: tal som float64 (`array("d")`), datoer som dage siden 1970
+(int64) og type/anbefaling som kategorier (små heltalskoder + opslagsliste).
+Værdierne parses én gang når shots lægges ind – ikke ved hver rerun.
+
+Rækkefølgen er nyeste først, ligesom historikken vises. `values()` og
+`to_frame()` giver numpy-kopier (én memcpy pr. kolonne): et levende view
+ville låse arrayets buffer, så næste gemte shot fejlede med BufferError.
+De danske kolonnenavne er kun en præsentations-mapping (`LABELS`).
+"""
+import datetime
+import math
+import re
+from array import array
+
+from storage import ENTRY_FIELDS
+
+# Kolonne → visningsnavn (samme som arkets nøgler → session-nøgler)
+LABELS = dict(ENTRY_FIELDS)
+FLOAT_COLS = ("dose", "yield", "time", "target_ratio", "target_out", "ratio")
+CATEGORY_COLS = ("type", "advice")
+TEXT_COLS = ("grind", "notes")
+
+EPOCH = datetime.date(1970, 1, 1)
+NAT = -(2 ** 63)  # numpy's NaT som int64
+
+
+def parse_float(x):
+    try:
+        if x is None:
+            return None
+        if isinstance(x, (int, float)):
+            return float(x)
+        x = str(x).replace(",", ".").strip()
+        return float(x) if x != "" else None
+    except Exception:
+        return None
+
+
+def slugify(s: str) -> str:
+    s = (s or "").strip().lower()
+    s = re.sub(r"[^a-z0-9]+", "-", s)
+    return s.strip("-") or "bean"
+
+
+def parse_day(x) -> int:
+    """Dato (date eller "YYYY-MM-DD") → dage siden 1970; NAT hvis ukendt."""
+    if isinstance(x, datetime.datetime):
+        x = x.date()
+    if not isinstance(x, datetime.date):
+        try:
+            x = datetime.date.fromisoformat(str(x).strip()[:10])
+        except ValueError:
+            return NAT
+    return (x - EPOCH).days
+
+
+def fmt_num(x: float) -> str:
+    """Til visning: 18.0 → "18", 2.05 → "2.05", NaN → ""."""
+    if x != x:
+        return ""
+    return str(int(x)) if x == int(x) and abs(x) < 1e15 else f"{x:g}"
+
+
+class ShotStore:
+    def __init__(self):
+        self.days = array("q")
+        self.floats = {c: array("d") for c in FLOAT_COLS}
+        self.codes = {c: array("i") for c in CATEGORY_COLS}
+        self.categories = {c: [] for c in CATEGORY_COLS}
+        self._cat_index = {c: {} for c in CATEGORY_COLS}
+        self.text = {c: [] for c in TEXT_COLS}
+        self.grind_num = array("d")  # kværn som tal (NaN hvis fx "2-3"), til analyse
+
+    def __len__(self):
+        return len(self.days)
+
+    # ---- indlæsning ----
+    def _code(self, col: str, value) -> int:
+        value = "" if value is None else str(value)
+        idx = self._cat_index[col]
+        if value not in idx:
+            idx[value] = len(self.categories[col])
+            self.categories[col].append(value)
+        return idx[value]
+
+    def _put(self, entry: dict, pos):
+        """Indsæt ét shot (dict med danske nøgler) på `pos` (None = bagerst).
+
+        Alle-eller-ingen: fejler en kolonne, fjernes det der allerede er sat
+        ind, så kolonnerne altid er lige lange.
+        """
+        cols = [(self.days, parse_day(entry.get(LABELS["date"], "")))]
+        for c in FLOAT_COLS:
+            v = parse_float(entry.get(LABELS[c], ""))
+            cols.append((self.floats[c], math.nan if v is None else v))
+        for c in CATEGORY_COLS:
+            cols.append((self.codes[c], self._code(c, entry.get(LABELS[c], ""))))
+        for c in TEXT_COLS:
+            v = entry.get(LABELS[c], "")
+            cols.append((self.text[c], "" if v is None else str(v)))
+        g = parse_float(entry.get(LABELS["grind"], ""))
+        cols.append((self.grind_num, math.nan if g is None else g))
+
+        done = []
+        try:
+            for arr, value in cols:
+                if pos is None:
+                    arr.append(value)
+                else:
+                    arr.insert(pos, value)
+                done.append(arr)
+        except BaseException:
+            for arr in done:
+                arr.pop(-1 if pos is None else pos)
+            raise
+
+    def insert_newest(self, entry: dict):
+        self._put(entry, 0)
+
+    def extend_older(self, entries: list):
+        """Tilføj ældre shots (nyeste først) bagerst, fx næste side fra lageret."""
+        for e in entries:
+            self._put(e, None)
+
+    @classmethod
+    def from_entries(cls, entries: list):
+        store = cls()
+        store.extend_older(entries)
+        return store
+
+    # ---- aflæsning ----
+    def date(self, i: int):
+        d = self.days[i]
+        return None if d == NAT else EPOCH + datetime.timedelta(days=d)
+
+    def category(self, col: str, i: int) -> str:
+        return self.categories[col][self.codes[col][i]]
+
+    def row(self, i: int) -> dict:
+        """Ét shot formateret til visning, med de danske nøgler."""
+        d = self.date(i)
+        out = {LABELS["date"]: d.isoformat() if d else ""}
+        for c in CATEGORY_COLS:
+            out[LABELS[c]] = self.category(c, i)
+        for c in TEXT_COLS:
+            out[LABELS[c]] = self.text[c][i]
+        for c in FLOAT_COLS:
+            out[LABELS[c]] = fmt_num(self.floats[c][i])
+        return {LABELS[c]: out[LABELS[c]] for c, _ in ENTRY_FIELDS}
+
+    def rows(self, limit: int = None):
+        n = len(self) if limit is None else min(limit, len(self))
+        for i in range(n):
+            yield self.row(i)
+
+    def values(self, col: str):
+        """Talkolonne som numpy-array (nyeste først, kopi); "grind" giver kværn som tal."""
+        import numpy as np
+
+        arr = self.grind_num if col == "grind" else self.floats[col]
+        return np.frombuffer(arr, dtype=np.float64).copy() if len(arr) else np.empty(0)
+
+    def to_frame(self, limit: int = None):
+        """DataFrame med danske kolonnenavne; tal-, dato- og kategorikolonner
+        kopieres direkte fra de underliggende arrays (ingen parsing)."""
+        import numpy as np
+        import pandas as pd
+
+        n = len(self) if limit is None else min(limit, len(self))
+        if n == 0:
+            return pd.DataFrame(columns=[label for _, label in ENTRY_FIELDS])
+        cols = {}
+        for c, label in ENTRY_FIELDS:
+            if c == "date":
+                cols[label] = np.frombuffer(self.days, dtype=np.int64)[:n].astype("datetime64[D]")
+            elif c in FLOAT_COLS:
+                cols[label] = np.frombuffer(self.floats[c], dtype=np.float64)[:n].copy()
+            elif c in CATEGORY_COLS:
+                cols[label] = pd.Categorical.from_codes(
+                    np.frombuffer(self.codes[c], dtype=np.int32)[:n].copy(), self.categories[c]
+                )
+            else:
+                cols[label] = self.text[c][:n]
+        return pd.DataFrame(cols)
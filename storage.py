@@ -0,0 +1,1625 @@
+"""Lagerlag for Espresso Advisor.
+
+app.py taler kun med et `Storage`-objekt. Backends:
+- `SheetsStorage`: Google Sheets (fanerne "beans" og "entries")
+- `IncrementalSheetsStorage`: som ovenfor, men med et proces-fælles
+  `SheetSnapshot` af arket (opslag pr. bruger/bønne) der kun henter nye
+  rækker (delta-synk) i stedet for at læse alt igen
+- `SQLiteStorage`: lokal SQLite-fil med index på (user_id, bean_id, date),
+  til udvikling og loadtest
+
+Flere serverprocesser på samme maskine kan dele snapshottet gennem en
+`SharedCache` (SQLite på disk), så arket kun hentes én gang for dem alle.
+
+`WriteBehindStorage` kan lægges uden om en backend, så skrivninger sættes i kø
+og skrives i batches af en baggrundstråd. Med en `Journal` skrives hver
+ændring først til en lokal fil, så intet går tabt ved nedbrud eller udfald.
+
+Modulet importerer ikke streamlit, så det kan bruges uden for appen.
+"""
+import concurrent.futures
+import contextlib
+import contextvars
+import datetime
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+try:
+    import fcntl  # fil-låse (POSIX); uden dem kan en journal ikke deles sikkert
+except ImportError:
+    fcntl = None
+
+BEANS_HEADER = ["user_id","bean_id","brand","name","process","target_ratio"]
+ENTRIES_HEADER = [
+    "user_id","bean_id","date","type","grind","dose","yield",
+    "time","target_ratio","target_out","ratio","advice","notes"
+]
+
+# Arkets kolonnenavn → dansk nøgle i session state (samme rækkefølge som arket)
+ENTRY_FIELDS = [
+    ("date", "Dato"),
+    ("type", "Type"),
+    ("grind", "Kværn"),
+    ("dose", "Dosis (g)"),
+    ("yield", "Udbytte (g)"),
+    ("time", "Tid (sek)"),
+    ("target_ratio", "Target ratio"),
+    ("target_out", "Mål ud (g)"),
+    ("ratio", "Faktisk ratio"),
+    ("advice", "Anbefaling"),
+    ("notes", "Noter"),
+]
+
+# --------------------------- Række-konvertering -----------------------------
+def bean_to_row(user_id: str, bean_id: str, bean: dict) -> list:
+    return [
+        user_id, bean_id, bean.get("brand",""), bean.get("name",""),
+        bean.get("process",""), bean.get("target_ratio",2.0),
+    ]
+
+def entry_to_row(user_id: str, bean_id: str, entry: dict) -> list:
+    return [user_id, bean_id] + [entry.get(label, "") for _, label in ENTRY_FIELDS]
+
+def row_to_bean(row: dict) -> dict:
+    return {
+        "brand": row.get("brand",""),
+        "name": row.get("name",""),
+        "process": row.get("process",""),
+        "target_ratio": float(row.get("target_ratio", 2.0) or 2.0),
+        "entries": [],
+    }
+
+def row_to_entry(row: dict) -> dict:
+    return {label: row.get(col, "") for col, label in ENTRY_FIELDS}
+
+def col_letter(n: int) -> str:
+    """1 → A, 13 → M, 27 → AA."""
+    s = ""
+    while n:
+        n, r = divmod(n - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+def sheet_record(header: list, r: list) -> dict:
+    """Arkrække (liste) → dict som get_all_records, men med tekst-nøgler."""
+    row = {h: numericise(r[i]) if i < len(r) else "" for i, h in enumerate(header)}
+    # Nøglerne sammenlignes som tekst (et alias som "123" må ikke blive et tal)
+    for i, key in enumerate(header[:2]):
+        if key in ("user_id", "bean_id"):
+            row[key] = str(r[i]) if i < len(r) else ""
+    return row
+
+def row_blocks(rows: list) -> list:
+    """Sammenhængende rækkenumre → [(første, sidste), ...] stigende."""
+    out, start, prev = [], None, None
+    for r in sorted(rows):
+        if start is None:
+            start = prev = r
+        elif r == prev + 1:
+            prev = r
+        else:
+            out.append((start, prev))
+            start = prev = r
+    if start is not None:
+        out.append((start, prev))
+    return out
+
+def row_ranges(rows: list, last_col: str) -> list:
+    """Sammenhængende rækkenumre → så få A1-intervaller som muligt."""
+    return [f"A{a}:{last_col}{b}" for a, b in row_blocks(rows)]
+
+def window(items: list, limit, offset: int = 0) -> list:
+    return items[offset:] if limit is None else items[offset:offset + limit]
+
+_READ_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="storage-read")
+
+def parallel(*fns) -> list:
+    """Kør uafhængige læsninger samtidigt og returnér resultaterne i orden.
+
+    Hver kører i en kopi af kalderens context, så fx gatewayens prioritetsbane
+    følger med. Må ikke kaldes fra en funktion der selv kører via `parallel`.
+    """
+    if len(fns) < 2:
+        return [fn() for fn in fns]
+    futures = [_READ_POOL.submit(contextvars.copy_context().run, fn) for fn in fns]
+    return [f.result() for f in futures]
+
+# --------------------------- Arkiv-partitioner -----------------------------
+# Gamle shots flyttes fra "entries" (den varme partition) til arkivfaner pr.
+# periode. Hver komprimering tæller en epoke op i en markør-celle i entries'
+# header-række, så alle processer kan se at rækkenumrene har flyttet sig.
+ARCHIVE_PREFIX = "entries_"
+ARCHIVE_UNDATED = ARCHIVE_PREFIX + "udateret"
+MARKER = "compacted:"   # "compacted:<epoke>"
+LEASE = "compacting:"   # "compacting:<epoke>:<token>:<udløb>" mens en komprimering kører
+
+def archive_title(date_value, period: str = "year") -> str:
+    """Arkivfanen et shot hører til, ud fra dets dato ("entries_2025")."""
+    try:
+        d = datetime.date.fromisoformat(str(date_value or "").strip()[:10])
+    except ValueError:
+        return ARCHIVE_UNDATED
+    return f"{ARCHIVE_PREFIX}{d.year}" + (f"_{d.month:02d}" if period == "month" else "")
+
+def archive_order(titles) -> list:
+    """Arkivfaner nyeste periode først, udaterede til sidst."""
+    titles = set(titles)
+    return sorted(titles - {ARCHIVE_UNDATED}, reverse=True) + sorted(titles & {ARCHIVE_UNDATED})
+
+def read_marker(header_row: list) -> tuple:
+    """(epoke, lease eller None, kolonneindeks eller None) fra entries' header."""
+    for i, v in enumerate(header_row):
+        v = str(v)
+        try:
+            if v.startswith(MARKER):
+                return int(v[len(MARKER):] or 0), None, i
+            if v.startswith(LEASE):
+                epoch, token, until = v[len(LEASE):].split(":")
+                return int(epoch), (token, float(until)), i
+        except ValueError:
+            continue
+    return 0, None, None
+
+def numericise(v):
+    """Som gspread's get_all_records: tal-strenge bliver til int/float."""
+    if isinstance(v, str) and v.strip():
+        try:
+            return int(v)
+        except ValueError:
+            try:
+                return float(v)
+            except ValueError:
+                return v
+    return v
+
+
+# --------------------------- Interface -------------------------------------
+class RowsMoved(Exception):
+    """Arkrækkerne er flyttet (komprimeret) siden snapshottet blev læst."""
+
+
+class Storage:
+    """Fælles interface for alle lager-backends."""
+
+    name = "base"
+
+    def load_user_data(self, user_id: str, entries_limit: int = None) -> dict:
+        """Returnér {bean_id: bean} for brugeren, med shots under "entries".
+
+        Shots er sorteret nyeste først. `entries_limit` begrænser antallet pr.
+        bønne (0 = ingen); resten hentes ved behov med `load_entries`.
+        """
+        raise NotImplementedError
+
+    def load_entries(self, user_id: str, bean_id: str, limit: int = None,
+                     offset: int = 0) -> list:
+        """Et vindue af en bønnes shots, nyeste først."""
+        entries = self.load_user_data(user_id).get(bean_id, {}).get("entries", [])
+        return window(entries, limit, offset)
+
+    def count_entries(self, user_id: str, bean_id: str) -> int:
+        return len(self.load_entries(user_id, bean_id))
+
+    def count_archived(self, user_id: str, bean_id: str) -> int:
+        """Antal arkiverede shots ud over dem `load_entries` ser (0 uden arkiv)."""
+        return 0
+
+    def load_archived(self, user_id: str, bean_id: str, limit: int = None,
+                      offset: int = 0) -> list:
+        """Et vindue af bønnens arkiverede shots, nyeste først."""
+        return []
+
+    def compaction_epoch(self) -> int:
+        """Tæller der skifter når gamle shots arkiveres; vinduer (offset) i
+        `load_entries` fra før et skift passer ikke længere."""
+        return 0
+
+    def iter_entries(self, user_id: str, bean_id: str, chunk: int = 500):
+        """En bønnes shots ældste først, i lister af højst `chunk` (eksport).
+
+        Standard: vinduer bagfra. Kommer der nye shots til undervejs,
+        forskydes vinduerne; backends med stabile nøgler overskriver.
+        """
+        total = self.count_entries(user_id, bean_id)
+        for end in range(total, 0, -chunk):
+            start = max(0, end - chunk)
+            yield self.load_entries(user_id, bean_id, end - start, start)[::-1]
+
+    def upsert_bean(self, user_id: str, bean_id: str, bean: dict):
+        raise NotImplementedError
+
+    def append_entry(self, user_id: str, bean_id: str, entry: dict):
+        raise NotImplementedError
+
+    def list_user_ids(self) -> list:
+        raise NotImplementedError
+
+    def write_batch(self, beans: dict, entries: list):
+        """Skriv mange ændringer på én gang.
+
+        `beans` er {(user_id, bean_id): bean}, `entries` er en liste af
+        (user_id, bean_id, entry). Backends med billigere bulk-kald overskriver.
+        """
+        for (user_id, bean_id), bean in beans.items():
+            self.upsert_bean(user_id, bean_id, bean)
+        for user_id, bean_id, entry in entries:
+            self.append_entry(user_id, bean_id, entry)
+
+    def pending(self) -> int:
+        """Antal ændringer der endnu ikke er skrevet til backend."""
+        return 0
+
+    def reload(self):
+        """Smid evt. lokal cache væk, så næste læsning går helt til kilden."""
+
+    def count_rows(self, user_id: str) -> tuple:
+        """Antal (beans, entries) for brugeren – bruges af diagnosen."""
+        beans = self.load_user_data(user_id)
+        return len(beans), sum(len(b["entries"]) for b in beans.values())
+
+
+# --------------------------- Google Sheets ---------------------------------
+class SheetsStorage(Storage):
+    """Backend oven på to gspread-worksheets."""
+
+    name = "sheets"
+
+    def __init__(self, ws_beans, ws_entries):
+        self.ws_beans = ws_beans
+        self.ws_entries = ws_entries
+
+    def load_user_data(self, user_id: str, entries_limit: int = None) -> dict:
+        beans: dict[str, dict] = {}
+        if entries_limit == 0:
+            bean_rows, entry_rows = self.ws_beans.get_all_records(), []
+        else:
+            # Begge faner hentes samtidigt (én rundtur i stedet for to)
+            bean_rows, entry_rows = parallel(
+                self.ws_beans.get_all_records, self.ws_entries.get_all_records
+            )
+        for row in bean_rows:
+            if row.get("user_id") == user_id:
+                beans[row["bean_id"]] = row_to_bean(row)
+        if beans:
+            for row in entry_rows:
+                if row.get("user_id") == user_id and row.get("bean_id") in beans:
+                    beans[row["bean_id"]]["entries"].append(row_to_entry(row))
+        for bean in beans.values():
+            bean["entries"] = window(bean["entries"][::-1], entries_limit)
+        return beans
+
+    def upsert_bean(self, user_id: str, bean_id: str, bean: dict):
+        values = bean_to_row(user_id, bean_id, bean)
+        rows = self.ws_beans.get_all_values()
+        if rows:
+            for idx, r in enumerate(rows[1:], start=2):
+                if len(r) >= 2 and r[0] == user_id and r[1] == bean_id:
+                    self.ws_beans.update(f"A{idx}:F{idx}", [values])
+                    return
+        self.ws_beans.append_row(values)
+
+    def append_entry(self, user_id: str, bean_id: str, entry: dict):
+        self.ws_entries.append_row(entry_to_row(user_id, bean_id, entry))
+
+    def write_batch(self, beans: dict, entries: list):
+        # Højst ét kald pr. slags: batch_update for eksisterende bønner,
+        # append_rows for nye bønner og for alle shots
+        if beans:
+            existing = {}
+            for idx, r in enumerate(self.ws_beans.get_all_values()[1:], start=2):
+                if len(r) >= 2:
+                    existing[(r[0], r[1])] = idx
+            updates, new_rows = [], []
+            for key, bean in beans.items():
+                values = bean_to_row(key[0], key[1], bean)
+                if key in existing:
+                    idx = existing[key]
+                    updates.append({"range": f"A{idx}:F{idx}", "values": [values]})
+                else:
+                    new_rows.append(values)
+            if updates:
+                self.ws_beans.batch_update(updates)
+            if new_rows:
+                self.ws_beans.append_rows(new_rows)
+        if entries:
+            self.ws_entries.append_rows([entry_to_row(u, b, e) for u, b, e in entries])
+
+    def list_user_ids(self) -> list:
+        vals = self.ws_beans.get_all_values()
+        if not vals or len(vals) < 2:
+            return []
+        # kolonne A antages at være 'user_id'
+        return sorted({r[0] for r in vals[1:] if r and r[0]})
+
+
+class SheetSnapshot:
+    """Proces-fælles kopi af begge faner med opslag pr. bruger og pr. bønne.
+
+    Bygges løbende af de rækker synk'en henter, så et opslag for én bruger
+    aldrig skal gennem andre brugeres rækker. For "entries" holdes kun
+    nøglerne (hvilke arkrækker hører til hvilken bønne); selve shots hentes
+    med intervallæsninger når de skal vises og gemmes i `entry_cache`.
+    """
+
+    def __init__(self):
+        self.header = {"beans": list(BEANS_HEADER), "entries": list(ENTRIES_HEADER)}
+        self.seen = {"beans": 0, "entries": 0}  # antal arkrækker læst (inkl. header)
+        self.bean_rows: dict[tuple, int] = {} # (user_id, bean_id) → arkets rækkenummer
+        self.beans: dict[str, dict] = {}      # user_id → {bean_id: stamdata}
+        self.entry_rows: dict[tuple, list] = {}  # (user_id, bean_id) → arkrækker, stigende
+        self.entry_cache: dict[int, dict] = {}   # arkrække → shot (kun dem der er hentet)
+        self.entry_count: dict[str, int] = {}    # user_id → antal shot-rækker
+        self.marker = (0, None, None)            # read_marker() ved seneste synk
+        self.epoch = None                        # komprimerings-epoke snapshottet bygger på
+        self.gen = None                          # SharedCache-generation (med delt cache)
+        self.version = 0                         # ... og seneste version hentet derfra
+
+    def add_bean_row(self, row: dict, row_number: int):
+        key = (row.get("user_id", ""), row.get("bean_id", ""))
+        # Ved dubletter er det (som hidtil) den øverste række der opdateres
+        if key[0] and key not in self.bean_rows:
+            self.bean_rows[key] = row_number
+            self.set_bean(key, row)
+
+    def set_bean(self, key: tuple, row: dict):
+        bean = row_to_bean(row)
+        del bean["entries"]
+        self.beans.setdefault(key[0], {})[key[1]] = bean
+
+    def add_entry_key(self, user_id: str, bean_id: str, row_number: int):
+        if not user_id:
+            return
+        self.entry_rows.setdefault((user_id, bean_id), []).append(row_number)
+        self.entry_count[user_id] = self.entry_count.get(user_id, 0) + 1
+
+    def entry_window(self, user_id: str, bean_id: str, limit=None, offset: int = 0) -> list:
+        """Arkrækkerne for et vindue af bønnens shots, nyeste først."""
+        rows = self.entry_rows.get((user_id, bean_id), [])
+        return window(rows[::-1], limit, offset)
+
+    def bean_row(self, user_id: str, bean_id: str):
+        return self.bean_rows.get((user_id, bean_id))
+
+    def bean_unchanged(self, key: tuple, values: list) -> bool:
+        """Om `values` (en bean_to_row-række) svarer til det arket allerede har."""
+        cur = self.beans.get(key[0], {}).get(key[1])
+        if cur is None:
+            return False
+        new = row_to_bean(dict(zip(BEANS_HEADER, values)))
+        return all(cur[k] == new[k] for k in ("brand", "name", "process", "target_ratio"))
+
+    def user_ids(self) -> list:
+        return sorted(u for u, beans in self.beans.items() if beans)
+
+    def counts(self, user_id: str) -> tuple:
+        return len(self.beans.get(user_id, {})), self.entry_count.get(user_id, 0)
+
+
+class IncrementalSheetsStorage(SheetsStorage):
+    """Sheets-backend med delta-synk.
+
+    Holder et `SheetSnapshot` af begge faner og husker hvor mange rækker der
+    er set pr. fane. En synk læser kun halen (`A{n+1}:F` for beans og kun
+    nøglekolonnerne `A{n+1}:B` for entries) og fletter de nye rækker ind i
+    snapshottets opslag. Det virker fordi "entries" kun tilføjes i bunden.
+    Shots hentes først når de skal bruges, som ét `batch_get` af de rækker
+    der mangler. Rettelser af eksisterende bønner fra denne proces patches
+    direkte; ændringer lavet udefra fanges af en fuld genindlæsning hvert
+    `full_reload_every` sekund.
+
+    Med `spreadsheet` kan `compact()` flytte gamle shots til arkivfaner
+    ("entries_2025", ...), så "entries" og dermed synk og opslag holder sig
+    små. Almindelige læsninger rører kun "entries"; arkivet læses først med
+    `count_archived`/`load_archived` (fuld historik).
+
+    Med `shared` (en `SharedCache`) synker processen først fra disken og
+    læser kun fra Sheets når intervallerne på tværs af processerne siger
+    det, eller efter en skrivning. Det processen henter, lægges i cachen.
+    """
+
+    name = "sheets-incremental"
+
+    def __init__(self, ws_beans, ws_entries, min_sync_interval: float = 2.0,
+                 full_reload_every: float = 600.0, spreadsheet=None,
+                 archive_period: str = "year", shared: "SharedCache" = None):
+        super().__init__(ws_beans, ws_entries)
+        self.shared = shared
+        self.min_sync_interval = min_sync_interval
+        self.full_reload_every = full_reload_every
+        self.spreadsheet = spreadsheet
+        self.archive_period = archive_period
+        self._ws = {"beans": ws_beans, "entries": ws_entries}
+        # Kolonner læst ved synk: hele beans, men kun nøglerne for entries
+        self._width = {"beans": len(BEANS_HEADER), "entries": 2}
+        self._lock = threading.RLock()
+        self.reload()
+
+    def reload(self):
+        with self._lock:
+            self.snapshot = SheetSnapshot()
+            self._archives = None  # arkivindeks, hentes ved første behov
+            self._loaded_at = time.monotonic()
+            self._synced_at = None
+
+    # ---- synk ----
+    def _fetch_tail(self, name: str) -> tuple:
+        """Læs en fanes nye rækker uden at røre snapshottet.
+
+        → (nyt antal sete rækker, header eller None, markør eller None,
+        [(rækkenummer, række-dict)]). Snapshottet opdateres først af
+        `_fetch_tails`, når begge faner er læst.
+        """
+        snap = self.snapshot
+        seen = snap.seen[name]
+        ws, rng = self._ws[name], f"A{seen + 1}:{col_letter(self._width[name])}"
+        full_header = marker = None
+        if name == "entries":
+            # Header-rækken (med komprimerings-markøren) og nøglekolonnerne i
+            # samme kald – markøren koster altså ingen ekstra rundtur
+            head, values = ws.batch_get(["1:1", rng], value_render_option="UNFORMATTED_VALUE")
+            head = list(head[0]) if head else []
+            marker = read_marker(head)
+            if marker[2] is not None:
+                del head[marker[2]:]
+            full_header = head if seen == 0 else None
+        else:
+            values = ws.get(rng, value_render_option="UNFORMATTED_VALUE")
+        values = [list(r) for r in values or []]
+        new_seen = seen + len(values)
+        first = seen + 1
+        header = None
+        if seen == 0 and values:
+            header = [str(h) for h in values.pop(0)]
+            if full_header:
+                header = [str(h) for h in full_header]
+            first = 2
+        cols = (header or snap.header[name])[:self._width[name]]
+        rows = [(n, sheet_record(cols, r)) for n, r in enumerate(values, start=first)]
+        return new_seen, header, marker, rows
+
+    def sync(self, force: bool = False):
+        """Hent nye rækker fra arket (højst én gang pr. `min_sync_interval`)."""
+        with self._lock:
+            now = time.monotonic()
+            if self.shared is not None:
+                return self._sync_shared(force)
+            if now - self._loaded_at > self.full_reload_every:
+                self.reload()
+            if (not force and self._synced_at is not None
+                    and now - self._synced_at < self.min_sync_interval):
+                return
+            if self._fetch_tails() is None:
+                # Komprimeret (evt. af en anden proces): rækkenumrene har flyttet sig
+                self.reload()
+                return self.sync(force=True)
+            self._synced_at = now
+
+    def _fetch_tails(self):
+        """Hent og flet begge fanernes nye rækker → (beans, entries), eller
+        None hvis epoken er skiftet (så er snapshottet ubrugeligt)."""
+        # De to faner er uafhængige → én rundtur i stedet for to efter hinanden
+        tails = parallel(lambda: self._fetch_tail("beans"), lambda: self._fetch_tail("entries"))
+        snap = self.snapshot
+        marker = tails[1][2]
+        if snap.epoch is not None and marker[0] != snap.epoch:
+            return None
+        # Begge læsninger lykkedes → først nu tæller rækkerne som set
+        for name, (new_seen, header, _, _) in zip(("beans", "entries"), tails):
+            snap.seen[name] = new_seen
+            if header is not None:
+                snap.header[name] = header
+        snap.marker, snap.epoch = marker, marker[0]
+        beans, entries = tails[0][3], tails[1][3]
+        for n, row in beans:
+            snap.add_bean_row(row, n)
+        for n, row in entries:
+            snap.add_entry_key(row.get("user_id", ""), row.get("bean_id", ""), n)
+        return beans, entries
+
+    # ---- delt cache ----
+    def _sync_shared(self, force: bool):
+        shared = self.shared
+        if shared.state().get("gen") != self.snapshot.gen:
+            self.reload()  # ny generation (genindlæst eller komprimeret)
+        self._pull()
+        action = shared.claim(force, self.min_sync_interval, self.full_reload_every)
+        if self.snapshot.gen is None:
+            action = "reload"  # intet på disken endnu
+        if action == "sync":
+            tails = self._fetch_tails()
+            if tails is not None:
+                rows = [("beans", n, r) for n, r in tails[0]] + [("entries", n, r) for n, r in tails[1]]
+                if rows:
+                    shared.publish(self.snapshot.gen, rows, self.snapshot.seen,
+                                   header=self.snapshot.header)
+                self._pull()  # rækker andre processer har lagt der imens
+                return
+        if action is not None:
+            self.reload()
+            beans, entries = self._fetch_tails()
+            snap = self.snapshot
+            rows = [("beans", n, r) for n, r in beans] + [("entries", n, r) for n, r in entries]
+            snap.gen, snap.version = shared.replace(
+                rows, seen=snap.seen, header=snap.header, epoch=snap.epoch
+            )
+
+    def _pull(self):
+        """Flet rækker fra den delte cache, som en synk mod arket ville."""
+        snap = self.snapshot
+        if snap.gen is None:
+            meta = self.shared.state()
+            if meta.get("gen") is None:
+                return
+            snap.gen = meta["gen"]
+        meta, rows = self.shared.pull(snap.gen, snap.version)
+        if meta is None:
+            return  # generationen er skiftet; tages ved næste synk
+        for tab, n, row in rows:
+            if tab == "beans":
+                key = (row.get("user_id", ""), row.get("bean_id", ""))
+                if n > snap.seen["beans"]:
+                    snap.add_bean_row(row, n)
+                elif snap.bean_rows.get(key) == n:
+                    snap.set_bean(key, row)  # rettet på stedet
+            elif n > snap.seen["entries"]:
+                snap.add_entry_key(row.get("user_id", ""), row.get("bean_id", ""), n)
+        for tab, n in meta.get("seen", {}).items():
+            snap.seen[tab] = max(snap.seen[tab], n)
+        snap.header = {k: list(v) for k, v in meta.get("header", snap.header).items()}
+        snap.epoch = meta.get("epoch", snap.epoch)
+        snap.version = meta["version"]
+
+    def _share_beans(self, rows: list):
+        """Bønner rettet på stedet af denne proces → den delte cache."""
+        if self.shared is not None and self.snapshot.gen is not None:
+            self.shared.put_rows(self.snapshot.gen, [("beans", n, r) for n, r in rows])
+
+    def ensure_headers(self):
+        """Skriv header-rækker i tomme faner. Bruger første synk, så det ikke
+        koster en ekstra læsning pr. fane ved opstart."""
+        with self._lock:
+            self.sync()
+            empty = [name for name, seen in self.snapshot.seen.items() if seen == 0]
+        for name in empty:
+            self._ws[name].append_row(BEANS_HEADER if name == "beans" else ENTRIES_HEADER)
+        if empty:
+            with self._lock:
+                self.reload()
+                self.sync()
+
+    def headers(self) -> dict:
+        """Fanernes header-rækker som de stod ved seneste synk."""
+        with self._lock:
+            self.sync()
+            return {k: list(v) for k, v in self.snapshot.header.items()}
+
+    def _read_entries(self, rows: list, ws=None, header: list = None, keys: dict = None,
+                      epoch: int = None) -> dict:
+        """{arkrække: shot} for `rows` med ét batch_get (uden om cachen).
+
+        Rækkenumre i "entries" gælder kun inden for én komprimerings-epoke.
+        Derfor læses header-rækken med i samme kald, og er epoken en anden
+        end `epoch` (default snapshottets), eller hører en række ikke til den
+        bønne `keys` ({arkrække: (user_id, bean_id)}) siger → RowsMoved.
+        Arkivfaner (`ws` givet) ændres kun i bunden og tjekkes ikke.
+        """
+        if not rows:
+            return {}
+        hot = ws is None
+        ws = ws or self.ws_entries
+        header = header or self.snapshot.header["entries"]
+        ranges = row_ranges(rows, col_letter(len(header)))
+        if not hot:
+            results = ws.batch_get(ranges, value_render_option="UNFORMATTED_VALUE")
+        else:
+            head, *results = ws.batch_get(["1:1"] + ranges, value_render_option="UNFORMATTED_VALUE")
+            expected = self.snapshot.epoch if epoch is None else epoch
+            found = read_marker(list(head[0]) if head else [])[0]
+            if expected is not None and found != expected:
+                raise RowsMoved(f"epoke {expected} → {found}")
+        out = {}
+        for rng, values in zip(ranges, results):
+            start = int(rng.split(":")[0][1:])
+            for n, r in enumerate(values, start=start):
+                rec = sheet_record(header, list(r))
+                if keys is not None and n in keys and \
+                        (str(rec.get("user_id", "")), str(rec.get("bean_id", ""))) != keys[n]:
+                    raise RowsMoved(f"række {n} tilhører ikke {keys[n]}")
+                out[n] = row_to_entry(rec)
+        return out
+
+    def _fetch_entries(self, rows: list, keys: dict):
+        """Hent manglende shots (arkrækker) ind i cachen med ét batch_get."""
+        snap = self.snapshot
+        cache = snap.entry_cache
+        missing = [r for r in rows if r not in cache]
+        if missing and self.shared is not None and snap.gen is not None:
+            cache.update(self.shared.get_shots(snap.gen, missing))
+            missing = [r for r in missing if r not in cache]
+        fetched = self._read_entries(missing, keys=keys)
+        cache.update(fetched)
+        if fetched and self.shared is not None and snap.gen is not None:
+            self.shared.put_shots(snap.gen, fetched)
+
+    def _resync_on_moved(self, read):
+        """Kør `read()`; er rækkerne flyttet af en komprimering siden seneste
+        synk, genindlæses snapshottet og der læses én gang til."""
+        with self._lock:
+            try:
+                return read()
+            except RowsMoved:
+                self.reload()
+                self.sync(force=True)
+                return read()
+
+    def compaction_epoch(self) -> int:
+        with self._lock:
+            self.sync()
+            return self.snapshot.epoch or 0
+
+    # ---- Storage ----
+    def load_user_data(self, user_id: str, entries_limit: int = None) -> dict:
+        def read():
+            self.sync()
+            snap = self.snapshot
+            beans = {bid: dict(b, entries=[]) for bid, b in snap.beans.get(user_id, {}).items()}
+            if entries_limit == 0:
+                return beans
+            wanted = {bid: snap.entry_window(user_id, bid, entries_limit) for bid in beans}
+            self._fetch_entries([r for rows in wanted.values() for r in rows],
+                                {r: (user_id, bid) for bid, rows in wanted.items() for r in rows})
+            for bid, rows in wanted.items():
+                beans[bid]["entries"] = [dict(snap.entry_cache[r]) for r in rows if r in snap.entry_cache]
+            return beans
+        return self._resync_on_moved(read)
+
+    def load_entries(self, user_id: str, bean_id: str, limit: int = None,
+                     offset: int = 0) -> list:
+        def read():
+            self.sync()
+            snap = self.snapshot
+            if bean_id not in snap.beans.get(user_id, {}):
+                return []
+            rows = snap.entry_window(user_id, bean_id, limit, offset)
+            self._fetch_entries(rows, {r: (user_id, bean_id) for r in rows})
+            return [dict(snap.entry_cache[r]) for r in rows if r in snap.entry_cache]
+        return self._resync_on_moved(read)
+
+    def count_entries(self, user_id: str, bean_id: str) -> int:
+        with self._lock:
+            self.sync()
+            if bean_id not in self.snapshot.beans.get(user_id, {}):
+                return 0
+            return len(self.snapshot.entry_rows.get((user_id, bean_id), ()))
+
+    def iter_entries(self, user_id: str, bean_id: str, chunk: int = 500):
+        # Arkrækkerne ligger fast, så bidderne kan ikke forskydes. Rækker der
+        # ikke allerede er i cachen læses uden at blive lagt i den, så en
+        # eksport af hele arket ikke bliver liggende i hukommelsen.
+        # Komprimeres arket undervejs, fejler eksporten med RowsMoved i
+        # stedet for at springe shots over eller gentage dem.
+        with self._lock:
+            self.sync()
+            if bean_id not in self.snapshot.beans.get(user_id, {}):
+                return
+            rows = list(self.snapshot.entry_rows.get((user_id, bean_id), ()))
+            epoch = self.snapshot.epoch
+        key = (user_id, bean_id)
+        # Arkivet er ældst, så det kommer først
+        index, refs = self._archive_refs(user_id, bean_id)
+        refs = refs[::-1]
+        for i in range(0, len(refs), chunk):
+            yield self._read_archived(index, refs[i:i + chunk])
+        for i in range(0, len(rows), chunk):
+            part = rows[i:i + chunk]
+            with self._lock:
+                cache = self.snapshot.entry_cache if self.snapshot.epoch == epoch else {}
+                found = {r: cache[r] for r in part if r in cache}
+                try:
+                    found.update(self._read_entries([r for r in part if r not in found],
+                                                    keys=dict.fromkeys(part, key), epoch=epoch))
+                except RowsMoved as e:
+                    raise RowsMoved("Gamle shots blev arkiveret undervejs – prøv igen") from e
+            yield [dict(found[r]) for r in part if r in found]
+
+    # ---- arkiv ----
+    def _archive_index(self) -> dict:
+        """{fane: (worksheet, header, {(user_id, bean_id): arkrækker})}, nyeste
+        periode først. Hentes første gang nogen beder om fuld historik og
+        gælder indtil næste komprimering (arkiver ændres kun af den)."""
+        if self._archives is None:
+            sheets = []
+            if self.spreadsheet is not None:
+                found = {w.title: w for w in self.spreadsheet.worksheets()
+                         if w.title.startswith(ARCHIVE_PREFIX)}
+                sheets = [found[t] for t in archive_order(found)]
+            results = parallel(*[
+                (lambda w=w: w.batch_get(["1:1", "A2:B"], value_render_option="UNFORMATTED_VALUE"))
+                for w in sheets
+            ])
+            index = {}
+            for w, (head, values) in zip(sheets, results):
+                keys = {}
+                for n, r in enumerate(values or [], start=2):
+                    if r and r[0] != "":
+                        keys.setdefault((str(r[0]), str(r[1]) if len(r) > 1 else ""), []).append(n)
+                header = [str(h) for h in head[0]] if head else list(ENTRIES_HEADER)
+                index[w.title] = (w, header, keys)
+            self._archives = index
+        return self._archives
+
+    def count_archived(self, user_id: str, bean_id: str) -> int:
+        with self._lock:
+            return sum(len(keys.get((user_id, bean_id), ()))
+                       for _, _, keys in self._archive_index().values())
+
+    def _archive_refs(self, user_id: str, bean_id: str) -> tuple:
+        """(indeks, [(fane, arkrække)] nyeste først) for bønnens arkiverede shots."""
+        with self._lock:
+            index = self._archive_index()
+        refs = [(title, r) for title, (_, _, keys) in index.items()
+                for r in keys.get((user_id, bean_id), [])[::-1]]
+        return index, refs
+
+    def _read_archived(self, index: dict, refs: list) -> list:
+        titles = list(dict.fromkeys(t for t, _ in refs))
+        found = dict(zip(titles, parallel(*[
+            (lambda t=t: self._read_entries([r for tt, r in refs if tt == t],
+                                            index[t][0], index[t][1]))
+            for t in titles
+        ])))
+        return [dict(found[t][r]) for t, r in refs if r in found[t]]
+
+    def load_archived(self, user_id: str, bean_id: str, limit: int = None,
+                      offset: int = 0) -> list:
+        index, refs = self._archive_refs(user_id, bean_id)
+        return self._read_archived(index, window(refs, limit, offset))
+
+    def compact(self, max_age_days: int = None, keep_per_bean: int = None,
+                lease_seconds: float = 600.0, settle: float = 2.0, today=None) -> int:
+        """Flyt gamle shots fra "entries" til arkivfaner pr. periode.
+
+        Flyttes gør alt ud over de `keep_per_bean` nyeste pr. bønne og alt
+        ældre end `max_age_days` (None eller 0 = ingen grænse). Forløb:
+        1. en lease i markør-cellen, så kun én proces komprimerer ad gangen
+        2. rækkerne læses og tilføjes arkivfanerne (append_rows)
+        3. ét atomisk batch_update sletter dem i "entries" og tæller epoken op
+        Et nedbrud mellem 2 og 3 giver dubletter i arkivet, aldrig tab.
+        Returnerer antal flyttede shots.
+        """
+        max_age_days, keep_per_bean = max_age_days or None, keep_per_bean or None
+        if self.spreadsheet is None or (max_age_days is None and keep_per_bean is None):
+            return 0
+        ws = self.ws_entries
+        with self._lock:
+            self.sync(force=True)
+            snap = self.snapshot
+            epoch, lease, col = snap.marker
+            if lease is not None and lease[1] > time.time():
+                return 0  # en anden proces er i gang
+            header = list(snap.header["entries"])
+            move = set()
+            if keep_per_bean is not None:
+                for rows in snap.entry_rows.values():
+                    move.update(rows[:max(0, len(rows) - keep_per_bean)])
+            last_row = snap.seen["entries"]
+        if max_age_days is not None and last_row > 1:
+            cutoff = (today or datetime.date.today()) - datetime.timedelta(days=max_age_days)
+            date_col = col_letter(header.index("date") + 1)
+            dates = ws.get(f"{date_col}2:{date_col}{last_row}", value_render_option="UNFORMATTED_VALUE")
+            for n, r in enumerate(dates or [], start=2):
+                try:
+                    if r and datetime.date.fromisoformat(str(r[0]).strip()[:10]) < cutoff:
+                        move.add(n)
+                except ValueError:
+                    pass
+        with self._lock:
+            # Kun rækker der stadig er shots ifølge snapshottet (ikke header/tomme)
+            known = {r for rows in self.snapshot.entry_rows.values() for r in rows}
+        move = sorted(move & known)
+        if not move:
+            return 0
+
+        # 1. lease – skriv, vent lidt, og se om det stadig er vores
+        marker_col = len(header) if col is None else col
+        cell = f"{col_letter(marker_col + 1)}1"
+        token = uuid.uuid4().hex[:8]
+        ws.update(cell, [[f"{LEASE}{epoch}:{token}:{time.time() + lease_seconds:.0f}"]])
+        time.sleep(settle)
+        cur_epoch, cur_lease, _ = read_marker(ws.row_values(1))
+        if cur_epoch != epoch or cur_lease is None or cur_lease[0] != token:
+            return 0
+        try:
+            # 2. kopiér til arkivfanerne
+            last_col = col_letter(len(header))
+            ranges = row_ranges(move, last_col)
+            rows = []
+            for i in range(0, len(ranges), 200):
+                part = ranges[i:i + 200]
+                rows.extend(r for block in ws.batch_get(part, value_render_option="UNFORMATTED_VALUE")
+                            for r in block)
+            date_idx = header.index("date")
+            parts: dict[str, list] = {}
+            for r in rows:
+                r = list(r) + [""] * (len(header) - len(r))
+                parts.setdefault(archive_title(r[date_idx], self.archive_period), []).append(r)
+            existing = {w.title: w for w in self.spreadsheet.worksheets()}
+            for title, part_rows in parts.items():
+                target = existing.get(title)
+                if target is None:
+                    target = self.spreadsheet.add_worksheet(title=title, rows=1000, cols=len(header))
+                    target.append_row(header)
+                target.append_rows(part_rows)
+
+            # 3. slet i "entries" og tæl epoken op – i ét atomisk kald
+            sheet_id = ws.id
+            requests = [
+                {"deleteDimension": {"range": {
+                    "sheetId": sheet_id, "dimension": "ROWS", "startIndex": a - 1, "endIndex": b,
+                }}}
+                for a, b in reversed(row_blocks(move))
+            ]
+            requests.append({"updateCells": {
+                "rows": [{"values": [{"userEnteredValue": {"stringValue": f"{MARKER}{epoch + 1}"}}]}],
+                "fields": "userEnteredValue",
+                "start": {"sheetId": sheet_id, "rowIndex": 0, "columnIndex": marker_col},
+            }})
+            with self._lock:
+                self.spreadsheet.batch_update({"requests": requests})
+                self.reload()
+                # Synk straks, så en delt cache får den nye generation med det samme
+                self.sync(force=True)
+        except Exception:
+            # Slip lease'n; arkivet kan have fået dubletter, men intet er slettet
+            ws.update(cell, [[f"{MARKER}{epoch}"]])
+            raise
+        return len(move)
+
+    def upsert_bean(self, user_id: str, bean_id: str, bean: dict):
+        # Rækken findes via snapshottets indeks → højst ét målrettet kald,
+        # og intet kald når bønnen er uændret (fx ved hvert gemt shot)
+        values = bean_to_row(user_id, bean_id, bean)
+        with self._lock:
+            self.sync()
+            if self.snapshot.bean_unchanged((user_id, bean_id), values):
+                return
+            idx = self.snapshot.bean_row(user_id, bean_id)
+            if idx is not None:
+                self.ws_beans.update(f"A{idx}:F{idx}", [values])
+                row = dict(zip(BEANS_HEADER, values))
+                self.snapshot.set_bean((user_id, bean_id), row)
+                self._share_beans([(idx, row)])
+                return
+        # Nye rækker hentes ind af næste synk (så rækkenumrene passer)
+        self.ws_beans.append_row(values)
+        self._sync_after_write()
+
+    def append_entry(self, user_id: str, bean_id: str, entry: dict):
+        super().append_entry(user_id, bean_id, entry)
+        self._sync_after_write()
+
+    def _sync_after_write(self):
+        """Hent de netop skrevne rækker ind. Skrivningen er lykkedes, så en
+        fejl her må ikke få kalderen til at skrive igen (dubletter) – den
+        næste synk henter rækkerne, da `seen` ikke er rykket."""
+        try:
+            self.sync(force=True)
+        except Exception:
+            pass
+
+    def write_batch(self, beans: dict, entries: list):
+        with self._lock:
+            self.sync(force=True)
+            updates, new_rows = [], []
+            for key, bean in beans.items():
+                values = bean_to_row(key[0], key[1], bean)
+                if self.snapshot.bean_unchanged(key, values):
+                    continue
+                idx = self.snapshot.bean_row(*key)
+                if idx is not None:
+                    updates.append((idx, key, values))
+                else:
+                    new_rows.append(values)
+            if updates:
+                self.ws_beans.batch_update(
+                    [{"range": f"A{i}:F{i}", "values": [v]} for i, _, v in updates]
+                )
+                for _, key, values in updates:
+                    self.snapshot.set_bean(key, dict(zip(BEANS_HEADER, values)))
+                self._share_beans([(i, dict(zip(BEANS_HEADER, v))) for i, _, v in updates])
+        if new_rows:
+            self.ws_beans.append_rows(new_rows)
+        if entries:
+            self.ws_entries.append_rows([entry_to_row(u, b, e) for u, b, e in entries])
+        if new_rows or entries:
+            self._sync_after_write()
+
+    def list_user_ids(self) -> list:
+        with self._lock:
+            self.sync()
+            return self.snapshot.user_ids()
+
+    def count_rows(self, user_id: str) -> tuple:
+        with self._lock:
+            self.sync()
+            return self.snapshot.counts(user_id)
+
+
+# --------------------------- SQLite ----------------------------------------
+_SQL_UPSERT_BEAN = (
+    "INSERT INTO beans (user_id, bean_id, brand, name, process, target_ratio)"
+    " VALUES (?, ?, ?, ?, ?, ?)"
+    " ON CONFLICT (user_id, bean_id) DO UPDATE SET"
+    " brand = excluded.brand, name = excluded.name,"
+    " process = excluded.process, target_ratio = excluded.target_ratio"
+)
+_SQL_INSERT_ENTRY = (
+    "INSERT INTO entries (" + ", ".join(f'"{c}"' for c in ENTRIES_HEADER) + ")"
+    " VALUES (" + ", ".join("?" for _ in ENTRIES_HEADER) + ")"
+)
+
+class SQLiteStorage(Storage):
+    """Lokal backend. Kolonnerne er uden type, så værdier gemmes som de kommer
+    (tal som tal, tomme felter som "") – ligesom i arket."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        # Streamlit kører sessioner i tråde → én forbindelse bag en lås
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS beans ("
+                " user_id, bean_id, brand, name, process, target_ratio,"
+                " PRIMARY KEY (user_id, bean_id))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                + ", ".join(f'"{c}"' for c in ENTRIES_HEADER) + ")"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_entries_user_bean_date"
+                " ON entries (user_id, bean_id, date)"
+            )
+            # Historik-vinduer (nyeste først) pr. bønne
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_entries_user_bean_id"
+                " ON entries (user_id, bean_id, id)"
+            )
+
+    def load_user_data(self, user_id: str, entries_limit: int = None) -> dict:
+        with self._lock:
+            bean_rows = self._conn.execute(
+                "SELECT * FROM beans WHERE user_id = ? ORDER BY rowid", (user_id,)
+            ).fetchall()
+            if entries_limit is None:
+                entry_rows = self._conn.execute(
+                    "SELECT * FROM entries WHERE user_id = ? ORDER BY id DESC", (user_id,)
+                ).fetchall()
+        beans = {r["bean_id"]: row_to_bean(dict(r)) for r in bean_rows}
+        if entries_limit is None:
+            for r in entry_rows:
+                if r["bean_id"] in beans:
+                    beans[r["bean_id"]]["entries"].append(row_to_entry(dict(r)))
+        elif entries_limit:
+            for bid, bean in beans.items():
+                bean["entries"] = self.load_entries(user_id, bid, entries_limit)
+        return beans
+
+    def load_entries(self, user_id: str, bean_id: str, limit: int = None,
+                     offset: int = 0) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM entries WHERE user_id = ? AND bean_id = ?"
+                " ORDER BY id DESC LIMIT ? OFFSET ?",
+                (user_id, bean_id, -1 if limit is None else limit, offset),
+            ).fetchall()
+        return [row_to_entry(dict(r)) for r in rows]
+
+    def count_entries(self, user_id: str, bean_id: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM entries WHERE user_id = ? AND bean_id = ?",
+                (user_id, bean_id),
+            ).fetchone()[0]
+
+    def iter_entries(self, user_id: str, bean_id: str, chunk: int = 500):
+        # Keyset-paginering på id: stabil, og låsen holdes kun pr. bid
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT * FROM entries WHERE user_id = ? AND bean_id = ? AND id > ?"
+                    " ORDER BY id LIMIT ?",
+                    (user_id, bean_id, last, chunk),
+                ).fetchall()
+            if not rows:
+                return
+            last = rows[-1]["id"]
+            yield [row_to_entry(dict(r)) for r in rows]
+
+    def upsert_bean(self, user_id: str, bean_id: str, bean: dict):
+        with self._lock, self._conn:
+            self._conn.execute(_SQL_UPSERT_BEAN, bean_to_row(user_id, bean_id, bean))
+
+    def append_entry(self, user_id: str, bean_id: str, entry: dict):
+        with self._lock, self._conn:
+            self._conn.execute(_SQL_INSERT_ENTRY, entry_to_row(user_id, bean_id, entry))
+
+    def write_batch(self, beans: dict, entries: list):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                _SQL_UPSERT_BEAN, [bean_to_row(k[0], k[1], b) for k, b in beans.items()]
+            )
+            self._conn.executemany(
+                _SQL_INSERT_ENTRY,
+                [entry_to_row(u, b, e) for u, b, e in entries],
+            )
+
+    def list_user_ids(self) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT user_id FROM beans WHERE user_id != '' ORDER BY user_id"
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def count_rows(self, user_id: str) -> tuple:
+        with self._lock:
+            nb = self._conn.execute(
+                "SELECT COUNT(*) FROM beans WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+            ne = self._conn.execute(
+                "SELECT COUNT(*) FROM entries WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+        return nb, ne
+
+
+# --------------------------- Journal ---------------------------------------
+class JournalLocked(Exception):
+    """Journalfilen bruges allerede af en anden proces."""
+
+
+class Journal:
+    """Lokal append-only journal (JSON lines) for ændringer der skal synkes.
+
+    Hver ændring får et løbenummer og skrives + fsyncs før kaldet returnerer.
+    Når et batch er skrevet til backend, tilføjes `{"ack": n}`: alt til og med
+    n er synket. Ved opstart afspilles alt efter seneste ack. Et nedbrud lige
+    mellem skrivning og ack giver en gentagelse (at-least-once), aldrig et tab.
+
+    Løbenumrene gælder kun én fil, så filen låses eksklusivt (flock) så længe
+    journalen er åben: to processer kan aldrig skrive i eller afspille den
+    samme fil. Med flere serverprocesser bruges `Journal.for_process`.
+    """
+
+    def __init__(self, path: str, compact_bytes: int = 1 << 20):
+        self.path = path
+        self.compact_bytes = compact_bytes
+        self.seq = 0
+        self.acked = 0
+        self._fh = open(path, "a", encoding="utf-8")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._fh.close()
+                raise JournalLocked(path) from None
+        self._unacked = self._read()
+
+    @classmethod
+    def for_process(cls, path: str, slots: int = 64) -> "Journal":
+        """Processens egen journal: den første ledige af `path.0`, `path.1`, ...
+
+        Ikke-synkede ændringer i de andre ledige filer (fra processer der er
+        stoppet, eller den gamle fælles `path`) flyttes over i den valgte
+        journal, så de afspilles selv om der nu kører færre processer.
+        """
+        journal, orphans = None, []
+        for path_n in [f"{path}.{n}" for n in range(slots)] + [path]:
+            if journal is not None and not os.path.exists(path_n):
+                continue
+            try:
+                j = cls(path_n)
+            except JournalLocked:
+                continue
+            if journal is None and path_n != path:
+                journal = j
+            else:
+                orphans.append(j)
+        if journal is None:
+            for j in orphans:
+                j.close()
+            raise JournalLocked(f"{path}.*")
+        for j in orphans:
+            journal.adopt(j)
+        return journal
+
+    def adopt(self, other: "Journal"):
+        """Overtag en anden (låst) journals ikke-synkede ændringer og tøm den."""
+        for rec in other.replay():
+            seq = self.append(rec["kind"], rec["user_id"], rec["bean_id"], rec["data"])
+            self._unacked.append(dict(rec, seq=seq))
+        other._fh.truncate(0)
+        other._fh.flush()
+        os.fsync(other._fh.fileno())
+        other.close()  # filen bliver liggende tom; at slette den kunne ramme en ny ejer
+
+    def close(self):
+        self._fh.close()  # slipper også låsen
+
+    def _read(self) -> list:
+        records = []
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break  # halvt skrevet sidste linje efter nedbrud
+                    if "ack" in rec:
+                        # Efter komprimering er ack'en det eneste spor af
+                        # løbenumrene, så nye numre skal fortsætte derfra
+                        self.acked = max(self.acked, rec["ack"])
+                        self.seq = max(self.seq, rec["ack"])
+                    else:
+                        self.seq = max(self.seq, rec["seq"])
+                        records.append(rec)
+        except FileNotFoundError:
+            pass
+        return [r for r in records if r["seq"] > self.acked]
+
+    def replay(self) -> list:
+        """Ændringer fra sidste kørsel der endnu ikke er bekræftet synket."""
+        return list(self._unacked)
+
+    def _write(self, rec: dict):
+        self._fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def append(self, kind: str, user_id: str, bean_id: str, data: dict) -> int:
+        self.seq += 1
+        self._write({"seq": self.seq, "kind": kind, "user_id": user_id,
+                     "bean_id": bean_id, "data": data})
+        return self.seq
+
+    def ack(self, seq: int):
+        if seq <= self.acked:
+            return
+        self.acked = seq
+        self._write({"ack": seq})
+        # Alt er synket og filen er blevet stor → start forfra
+        if self.acked == self.seq and self._fh.tell() > self.compact_bytes:
+            self._fh.truncate(0)
+            self._fh.seek(0)
+            self._write({"ack": seq})
+
+
+# --------------------------- Delt cache ------------------------------------
+class SharedCache:
+    """Snapshot af arket på lokal disk (SQLite), delt af alle serverprocesser.
+
+    Indeholder de rækker synk'en har hentet (hele beans, nøglerne for
+    entries) og de shots der er læst. Alt hører til en generation; en ny
+    generation (fuld genindlæsning eller komprimering) erstatter den gamle
+    i én transaktion. Hver ændring får et stigende versionsnummer, så en
+    proces kun læser de rækker der er kommet til siden sidst. Kald mod
+    Sheets fordeles med `claim`: højst én halelæsning pr. interval for hele
+    maskinen, plus det skrivningerne selv udløser.
+    """
+
+    def __init__(self, path: str, source: str = ""):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            with self._txn():
+                self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key PRIMARY KEY, value)")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS rows (gen, tab, n INTEGER, version INTEGER, data,"
+                    " PRIMARY KEY (gen, tab, n))"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_rows_version ON rows (gen, version)")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS shots (gen, n INTEGER, data, PRIMARY KEY (gen, n))"
+                )
+                # Et andet ark i samme fil (fx efter skift af gsheet_id) → start forfra
+                if self._meta().get("source", source) != source:
+                    self._conn.execute("DELETE FROM meta")
+                    self._conn.execute("DELETE FROM rows")
+                    self._conn.execute("DELETE FROM shots")
+                self._set(source=source)
+
+    @contextlib.contextmanager
+    def _txn(self):
+        """Skrivetransaktion (BEGIN IMMEDIATE: én proces ad gangen)."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _meta(self) -> dict:
+        return {k: json.loads(v) for k, v in self._conn.execute("SELECT key, value FROM meta")}
+
+    def _set(self, **values):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [(k, json.dumps(v, ensure_ascii=False)) for k, v in values.items()],
+        )
+
+    def state(self) -> dict:
+        with self._lock:
+            return self._meta()
+
+    def claim(self, force: bool, min_interval: float, reload_every: float):
+        """Hvad skal denne proces hente fra Sheets? "reload", "sync" eller None.
+
+        Tidspunkterne ligger i filen, så intervallerne gælder alle processer.
+        Først en almindelig læsning; skrivelåsen (BEGIN IMMEDIATE) tages kun
+        når noget faktisk skal hentes, så læsninger ikke står i kø bag den.
+        """
+        def due(meta: dict, now: float):
+            if meta.get("gen") is None or now - meta.get("loaded_at", 0) >= reload_every:
+                return "reload"
+            if force or now - meta.get("synced_at", 0) >= min_interval:
+                return "sync"
+            return None
+
+        with self._lock:
+            if due(self._meta(), time.time()) is None:
+                return None
+            with self._txn():
+                # Igen under låsen: en anden proces kan være kommet først
+                now = time.time()
+                action = due(self._meta(), now)
+                if action == "reload":
+                    self._set(loaded_at=now, synced_at=now)
+                elif action == "sync":
+                    self._set(synced_at=now)
+                return action
+
+    def _insert(self, gen: str, rows: list, version: int, replace: bool = False):
+        verb = "REPLACE" if replace else "IGNORE"
+        self._conn.executemany(
+            f"INSERT OR {verb} INTO rows (gen, tab, n, version, data) VALUES (?, ?, ?, ?, ?)",
+            [(gen, tab, n, version, json.dumps(row, ensure_ascii=False)) for tab, n, row in rows],
+        )
+
+    def replace(self, rows: list, **state) -> tuple:
+        """Ny generation med `rows` [(fane, rækkenummer, række-dict)].
+        Returnerer (generation, version)."""
+        gen = uuid.uuid4().hex
+        with self._lock, self._txn():
+            version = self._meta().get("version", 0) + 1
+            self._conn.execute("DELETE FROM rows")
+            self._conn.execute("DELETE FROM shots")
+            self._insert(gen, rows, version)
+            self._set(gen=gen, version=version, **state)
+        return gen, version
+
+    def publish(self, gen: str, rows: list, seen: dict, **state) -> bool:
+        """Tilføj nyhentede rækker. False hvis generationen er skiftet imens."""
+        with self._lock, self._txn():
+            meta = self._meta()
+            if meta.get("gen") != gen:
+                return False
+            version = meta.get("version", 0) + 1
+            self._insert(gen, rows, version)
+            old = meta.get("seen", {})
+            self._set(version=version, seen={k: max(v, old.get(k, 0)) for k, v in seen.items()},
+                      **state)
+            return True
+
+    def put_rows(self, gen: str, rows: list):
+        """Overskriv rækker der er rettet på stedet (fx en bønne)."""
+        with self._lock, self._txn():
+            meta = self._meta()
+            if meta.get("gen") != gen:
+                return
+            version = meta.get("version", 0) + 1
+            self._insert(gen, rows, version, replace=True)
+            self._set(version=version)
+
+    def pull(self, gen: str, since: int) -> tuple:
+        """(meta, [(fane, n, række)] ændret efter version `since`), sorteret
+        efter rækkenummer. (None, []) hvis generationen er skiftet."""
+        with self._lock:
+            self._conn.execute("BEGIN")  # ét konsistent øjebliksbillede
+            try:
+                meta = self._meta()
+                if meta.get("gen") != gen:
+                    return None, []
+                rows = [(tab, n, json.loads(data)) for tab, n, data in self._conn.execute(
+                    "SELECT tab, n, data FROM rows WHERE gen = ? AND version > ? ORDER BY tab, n",
+                    (gen, since),
+                )]
+                return meta, rows
+            finally:
+                self._conn.execute("COMMIT")
+
+    def get_shots(self, gen: str, rows: list) -> dict:
+        out = {}
+        with self._lock:
+            for i in range(0, len(rows), 500):
+                part = rows[i:i + 500]
+                q = ("SELECT n, data FROM shots WHERE gen = ? AND n IN ("
+                     + ", ".join("?" for _ in part) + ")")
+                out.update((n, json.loads(d)) for n, d in self._conn.execute(q, [gen, *part]))
+        return out
+
+    def put_shots(self, gen: str, shots: dict):
+        if not shots:
+            return
+        with self._lock, self._txn():
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO shots (gen, n, data) VALUES (?, ?, ?)",
+                [(gen, n, json.dumps(e, ensure_ascii=False)) for n, e in shots.items()],
+            )
+
+
+# --------------------------- Write-behind ----------------------------------
+class WriteBehindStorage(Storage):
+    """Lægger skrivninger i en kø og skriver dem i batches fra en baggrundstråd.
+
+    Læsninger går til den underliggende backend, men ventende ændringer lægges
+    ovenpå, så en bruger altid ser sine egne shots – også før de er synket.
+    Fejl giver retry med eksponentiel backoff (med jitter); intet smides væk.
+    Med `journal` gemmes hver ændring lokalt først, og ikke-synkede ændringer
+    fra en tidligere kørsel lægges i køen igen ved opstart.
+    """
+
+    def __init__(self, inner: Storage, flush_delay: float = 0.5,
+                 max_backoff: float = 60.0, journal: Journal = None):
+        self.inner = inner
+        self.journal = journal
+        self.name = f"{inner.name}+write-behind"
+        self.flush_delay = flush_delay
+        self.max_backoff = max_backoff
+        self.last_error = None
+        self._beans: dict = {}
+        self._entries: list = []
+        # Batchet der er ved at blive skrevet (stadig "ventende" for læsere)
+        self._batch_beans: dict = {}
+        self._batch_entries: list = []
+        self._in_flight = 0
+        # Seqlock: tælles op når et batch tages og når det er færdigt, så den er
+        # ulige mens batchet skrives (og kan ligge både i køen og i backenden)
+        self._generation = 0
+        self._last_seq = 0    # journalens løbenummer for seneste ændring i køen
+        self._batch_seq = 0
+        self._cond = threading.Condition()
+        if journal is not None:
+            for rec in journal.replay():
+                self._queue(rec["kind"], rec["user_id"], rec["bean_id"], rec["data"])
+            self._last_seq = journal.seq
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    # ---- skrivninger: kun lokalt arbejde i kalderens tråd ----
+    def _queue(self, kind: str, user_id: str, bean_id: str, data: dict):
+        if kind == "bean":
+            # Senere upsert af samme bønne erstatter den ventende
+            self._beans[(user_id, bean_id)] = data
+        else:
+            self._entries.append((user_id, bean_id, data))
+
+    def _put(self, kind: str, user_id: str, bean_id: str, data: dict):
+        """Journalfør (hvis slået til) og læg i kø. Kaldes med låsen holdt."""
+        if self.journal is not None:
+            self._last_seq = self.journal.append(kind, user_id, bean_id, data)
+        self._queue(kind, user_id, bean_id, data)
+
+    def upsert_bean(self, user_id: str, bean_id: str, bean: dict):
+        with self._cond:
+            self._put("bean", user_id, bean_id, _bean_fields(bean))
+            self._cond.notify()
+
+    def append_entry(self, user_id: str, bean_id: str, entry: dict):
+        with self._cond:
+            self._put("entry", user_id, bean_id, dict(entry))
+            self._cond.notify()
+
+    def write_batch(self, beans: dict, entries: list):
+        with self._cond:
+            for (user_id, bean_id), bean in beans.items():
+                self._put("bean", user_id, bean_id, _bean_fields(bean))
+            for user_id, bean_id, entry in entries:
+                self._put("entry", user_id, bean_id, dict(entry))
+            self._cond.notify()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._beans) + len(self._entries) + self._in_flight
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Vent til køen er tom. Returnerer False ved timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._beans or self._entries or self._in_flight:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self._cond.wait(left)
+        return True
+
+    # ---- læsninger ----
+    def _stable_generation(self, timeout: float = 10.0) -> int:
+        """(Under `_cond`) vent til intet batch er undervejs → generationen.
+
+        Mens et batch skrives, kan dets rækker allerede være i backenden og
+        samtidig i køen; en læsning der overlapper det ville vise dem to gange.
+        """
+        self._cond.wait_for(lambda: self._generation % 2 == 0, timeout)
+        return self._generation
+
+    def _consistent(self, read, pick):
+        """Kør `read()` og returnér (resultat, pick() af køen) set samtidigt.
+
+        Hvis et batch tages eller lander mens vi læser, ville dets shots tælle
+        dobbelt → læs igen (højst et par gange) til køen og backend passer sammen.
+        """
+        for _ in range(3):
+            with self._cond:
+                gen = self._stable_generation()
+                pending = pick()
+            result = read()
+            with self._cond:
+                if gen == self._generation:
+                    break
+        return result, pending
+
+    def load_user_data(self, user_id: str, entries_limit: int = None) -> dict:
+        data, (beans, entries) = self._consistent(
+            lambda: self.inner.load_user_data(user_id, entries_limit),
+            lambda: ([(k, v) for k, v in self._pending_beans() if k[0] == user_id],
+                     [(b, e) for u, b, e in self._pending_entries() if u == user_id]),
+        )
+        for (_, bean_id), bean in beans:
+            old = data.get(bean_id, {})
+            data[bean_id] = dict(bean, entries=old.get("entries", []))
+        # Ventende shots er de nyeste → forrest
+        for bean_id, entry in entries:
+            if bean_id in data:
+                data[bean_id]["entries"].insert(0, dict(entry))
+        for bean in data.values():
+            bean["entries"] = window(bean["entries"], entries_limit)
+        return data
+
+    def load_entries(self, user_id: str, bean_id: str, limit: int = None,
+                     offset: int = 0) -> list:
+        # Ventende shots (nyeste først) foran backendens; vinduet deles mellem dem
+        for _ in range(3):
+            with self._cond:
+                gen = self._stable_generation()
+                pending = [dict(e) for u, b, e in self._pending_entries()
+                           if (u, b) == (user_id, bean_id)][::-1]
+            head = window(pending, limit, offset)
+            inner_limit = None if limit is None else limit - len(head)
+            inner = [] if inner_limit == 0 else self.inner.load_entries(
+                user_id, bean_id, inner_limit, max(0, offset - len(pending))
+            )
+            with self._cond:
+                if gen == self._generation:
+                    break
+        return head + inner
+
+    def count_entries(self, user_id: str, bean_id: str) -> int:
+        n, pending = self._consistent(
+            lambda: self.inner.count_entries(user_id, bean_id),
+            lambda: sum(1 for u, b, _ in self._pending_entries() if (u, b) == (user_id, bean_id)),
+        )
+        return n + pending
+
+    def count_archived(self, user_id: str, bean_id: str) -> int:
+        return self.inner.count_archived(user_id, bean_id)
+
+    def compaction_epoch(self) -> int:
+        return self.inner.compaction_epoch()
+
+    def load_archived(self, user_id: str, bean_id: str, limit: int = None,
+                      offset: int = 0) -> list:
+        return self.inner.load_archived(user_id, bean_id, limit, offset)
+
+    def iter_entries(self, user_id: str, bean_id: str, chunk: int = 500):
+        # Backendens shots og derefter dem i køen (de nyeste). Lander et batch
+        # undervejs, kan et shot komme med to gange – kald flush() først.
+        yield from self.inner.iter_entries(user_id, bean_id, chunk)
+        with self._cond:
+            pending = [dict(e) for u, b, e in self._pending_entries() if (u, b) == (user_id, bean_id)]
+        for i in range(0, len(pending), chunk):
+            yield pending[i:i + chunk]
+
+    def reload(self):
+        self.inner.reload()
+
+    def __getattr__(self, name):
+        # Backend-specifikke ting (fx headers/snapshot) slås op på den indre
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    def list_user_ids(self) -> list:
+        with self._cond:
+            pending_users = {k[0] for k, _ in self._pending_beans() if k[0]}
+        return sorted(set(self.inner.list_user_ids()) | pending_users)
+
+    def count_rows(self, user_id: str) -> tuple:
+        nb, ne = self.inner.count_rows(user_id)
+        with self._cond:
+            ne += sum(1 for u, _, _ in self._pending_entries() if u == user_id)
+        return nb, ne
+
+    # ---- baggrundstråd ----
+    def _pending_beans(self):
+        return list({**self._batch_beans, **self._beans}.items())
+
+    def _pending_entries(self):
+        return self._batch_entries + self._entries
+
+    def _run(self):
+        attempt = 0
+        while True:
+            with self._cond:
+                while not (self._beans or self._entries):
+                    self._cond.wait()
+            # Saml skrivninger der kommer tæt på hinanden i ét batch
+            time.sleep(self.flush_delay)
+            with self._cond:
+                self._batch_beans, self._beans = self._beans, {}
+                self._batch_entries, self._entries = self._entries, []
+                self._in_flight = len(self._batch_beans) + len(self._batch_entries)
+                # Batchet rummer alt i køen, dvs. alle løbenumre til og med dette
+                self._batch_seq = self._last_seq
+                self._generation += 1
+            try:
+                self.inner.write_batch(self._batch_beans, self._batch_entries)
+            except Exception as e:
+                self.last_error = e
+                with self._cond:
+                    # Læg batchet tilbage forrest; nyere bønne-versioner vinder
+                    self._beans = {**self._batch_beans, **self._beans}
+                    self._entries = self._batch_entries + self._entries
+                    self._batch_beans, self._batch_entries = {}, []
+                    self._in_flight = 0
+                    self._generation += 1
+                    self._cond.notify_all()
+                delay = min(self.max_backoff, 2 ** attempt) * (0.5 + random.random() / 2)
+                attempt += 1
+                time.sleep(delay)
+                continue
+            attempt = 0
+            self.last_error = None
+            with self._cond:
+                if self.journal is not None:
+                    try:
+                        self.journal.ack(self._batch_seq)
+                    except OSError as e:
+                        # Data er synket; uden ack afspilles det blot igen
+                        self.last_error = e
+                self._batch_beans, self._batch_entries = {}, []
+                self._in_flight = 0
+                self._generation += 1
+                self._cond.notify_all()
+
+
+def _bean_fields(bean: dict) -> dict:
+    """Kopi af bønnens stamdata til køen – kun arkets kolonner, så session-
+    data (shots, tællere) hverken journaliseres eller holdes i live."""
+    return {k: bean[k] for k in BEANS_HEADER[2:] if k in bean}
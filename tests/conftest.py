@@ -0,0 +1,40 @@
+"""Fælles fixtures: et falsk ark (fakesheets) med et par brugere og bønner."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakesheets import FakeSpreadsheet  # noqa: E402
+from storage import BEANS_HEADER, ENTRIES_HEADER, IncrementalSheetsStorage  # noqa: E402
+
+
+def entry_row(user_id: str, bean_id: str, note: str, date: str = "2026-01-01") -> list:
+    return [user_id, bean_id, date, "Double", 8, 18, 36, 27, 2, 36, 2, "", note]
+
+
+@pytest.fixture
+def sheet():
+    """alice/b1 med 10 shots efterfulgt af bob/b1 med 3 (noter = navn + nr.)."""
+    sh = FakeSpreadsheet()
+    sh.create("beans", [list(BEANS_HEADER), ["alice", "b1", "R", "b1", "W", 2],
+                        ["bob", "b1", "R", "b1", "W", 2]])
+    rows = [list(ENTRIES_HEADER)]
+    rows += [entry_row("alice", "b1", f"alice{i}", f"2025-01-{i + 1:02d}") for i in range(10)]
+    rows += [entry_row("bob", "b1", f"bob{i}", f"2026-01-{i + 1:02d}") for i in range(3)]
+    sh.create("entries", rows)
+    return sh
+
+
+@pytest.fixture
+def make_store(sheet):
+    """Fabrik for `IncrementalSheetsStorage` – ét kald = én serverproces."""
+    def make(**kwargs):
+        return IncrementalSheetsStorage(sheet._sheets["beans"], sheet._sheets["entries"],
+                                        spreadsheet=sheet, **kwargs)
+    return make
+
+
+def notes(entries: list) -> list:
+    return [e["Noter"] for e in entries]
@@ -0,0 +1,54 @@
+import math
+
+import numpy as np
+import pytest
+
+from analytics import ROLLING, BeanStats, recommend, recommend_batch, rolling_mean
+
+# Grænseværdier, manglende værdier og almindelige shots
+RATIO = [2.0, 1.8, 2.2, 1.79, 2.21, math.nan, 2.0, 1.5, math.nan, 2.6, 2.0, 1.9]
+TIME = [27.0, 25.0, 30.0, 28.0, 26.0, 24.0, math.nan, 33.0, math.nan, 20.0, 31.0, 29.5]
+GRIND = [8.0, 8.5, math.nan, 7.5, 9.0, 8.0, 8.2, 6.0, 8.0, 10.0, 7.0, 8.1]
+
+
+def test_recommend_batch_matches_recommend():
+    out = [36.0, 35.6, math.nan, 40.4] * 3
+    advice, kinds = recommend_batch(RATIO, TIME, out)
+    for i, (r, t, o) in enumerate(zip(RATIO, TIME, out)):
+        one, kind = recommend(r, t, 0 if o != o else o)
+        assert (advice[i], kinds[i]) == (one, kind)
+
+
+def test_from_arrays_matches_running_add():
+    running = BeanStats()
+    for g, r, t in zip(GRIND, RATIO, TIME):
+        running.add(g, r, t)
+    batch = BeanStats.from_arrays(np.array(GRIND), np.array(RATIO), np.array(TIME))
+
+    for name in ("shots", "scored", "hits", "kinds", "grind_min", "grind_max", "last_grind"):
+        assert getattr(batch, name) == getattr(running, name), name
+    for name in ("grind_time", "grind_ratio"):
+        a, b = getattr(batch, name), getattr(running, name)
+        assert a.n == b.n
+        assert a.slope() == pytest.approx(b.slope())
+        assert a.intercept() == pytest.approx(b.intercept())
+    assert batch.rolling() == pytest.approx(running.rolling())
+    assert batch.hit_rate() == running.hit_rate()
+    assert batch.suggest_grind() == running.suggest_grind()
+
+
+def test_empty_and_single_shot():
+    empty = BeanStats.from_arrays(np.empty(0), np.empty(0), np.empty(0))
+    assert empty.shots == 0 and empty.hit_rate() is None and empty.suggest_grind() is None
+    one = BeanStats()
+    one.add(8.0, 2.0, 27.0)
+    assert one.hit_rate() == 1.0 and one.suggest_grind() is None
+
+
+def test_rolling_mean_ignores_missing():
+    values = [1.0, math.nan, 3.0, 5.0, math.nan, 7.0, 9.0]
+    expected = []
+    for i in range(len(values)):
+        xs = [v for v in values[max(0, i - ROLLING + 1):i + 1] if v == v]
+        expected.append(sum(xs) / len(xs))
+    assert rolling_mean(values).tolist() == pytest.approx(expected)
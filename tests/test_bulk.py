@@ -0,0 +1,70 @@
+import io
+
+from bulk import export_file, import_file
+from storage import SQLiteStorage
+
+
+def csv_file(text: str) -> io.BytesIO:
+    return io.BytesIO(text.strip().encode("utf-8") + b"\n")
+
+
+def test_invalid_rows_are_rejected_with_line_numbers(tmp_path):
+    store = SQLiteStorage(str(tmp_path / "kaffe.db"))
+    result = import_file(store, csv_file("""
+user_id,bean_id,date,dose,yield,time,bean_target_ratio
+alice,b1,2026-01-01,18,36,27,2
+alice,b1,ikke-en-dato,18,36,27,2
+alice,b1,2026-01-02,-1,36,27,2
+,b1,2026-01-03,18,36,27,2
+alice,b1,2026-01-04,18,36,27,12
+alice,b1,2026-01-05,Dosis,36,27,2
+"""))
+    assert (result.rows, result.shots, result.rejected) == (6, 1, 5)
+    assert [line for line, _ in result.errors] == [3, 4, 5, 6, 7]
+    assert store.count_entries("alice", "b1") == 1
+
+
+def test_import_merges_into_existing_bean(tmp_path):
+    store = SQLiteStorage(str(tmp_path / "kaffe.db"))
+    store.upsert_bean("alice", "b1", {"brand": "Risteri", "name": "Kenya", "process": "W",
+                                      "target_ratio": 2.5})
+    result = import_file(store, csv_file("""
+bean_id,Dato,Dosis (g),Udbytte (g),Tid (sek)
+b1,2026-01-01,18,45,27
+"""), user_id="alice")
+    assert (result.beans, result.shots) == (0, 1)
+    bean = store.load_user_data("alice")["b1"]
+    assert (bean["brand"], bean["name"], bean["target_ratio"]) == ("Risteri", "Kenya", 2.5)
+    shot = bean["entries"][0]
+    assert float(shot["Target ratio"]) == 2.5
+    assert float(shot["Mål ud (g)"]) == 45
+
+    result = import_file(store, csv_file("""
+bean_id,process
+b1,N
+"""), user_id="alice")
+    assert result.beans == 1
+    bean = store.load_user_data("alice")["b1"]
+    assert (bean["name"], bean["process"]) == ("Kenya", "N")
+
+
+def test_export_import_round_trip(tmp_path):
+    src = SQLiteStorage(str(tmp_path / "src.db"))
+    src.upsert_bean("alice", "b1", {"brand": "R", "name": "Kenya", "process": "W", "target_ratio": 2})
+    src.upsert_bean("alice", "tom", {"brand": "R", "name": "Tom", "process": "", "target_ratio": 2.2})
+    src.upsert_bean("bob", "b2", {"brand": "S", "name": "Brasil", "process": "N", "target_ratio": 2})
+    import_file(src, csv_file("""
+user_id,bean_id,date,type,grind,dose,yield,time,notes
+alice,b1,2026-01-01,Double,8,18,36,27,første
+alice,b1,2026-01-02,Single,7.5,9,20,24,anden
+bob,b2,2026-01-03,Double,2-3,18,40,31,
+"""))
+
+    buf = io.BytesIO()
+    assert export_file(src, buf) == 4
+    dst = SQLiteStorage(str(tmp_path / "dst.db"))
+    buf.seek(0)
+    result = import_file(dst, buf)
+    assert (result.beans, result.shots, result.rejected) == (3, 3, 0)
+    for uid in ("alice", "bob"):
+        assert dst.load_user_data(uid) == src.load_user_data(uid)
@@ -0,0 +1,78 @@
+import datetime
+
+import pytest
+
+from conftest import entry_row, notes
+from storage import RowsMoved
+
+
+def test_compact_moves_old_rows_to_archive(sheet, make_store):
+    store = make_store()
+    before = notes(store.load_entries("alice", "b1"))
+    assert store.compact(keep_per_bean=4, settle=0) == 6
+
+    assert store.count_entries("alice", "b1") == 4
+    assert store.count_archived("alice", "b1") == 6
+    assert notes(store.load_entries("alice", "b1")) + notes(store.load_archived("alice", "b1")) == before
+    assert [w.title for w in sheet.worksheets()] == ["beans", "entries", "entries_2025"]
+    assert sheet._sheets["entries"].rows[0][-1] == "compacted:1"
+
+
+def test_compact_by_age(make_store):
+    store = make_store()
+    moved = store.compact(max_age_days=30, settle=0, today=datetime.date(2026, 1, 10))
+    assert moved == 10  # alle alices (2025), ingen af bobs
+    assert store.count_entries("bob", "b1") == 3
+
+
+def test_zero_disables_a_criterion(make_store):
+    store = make_store()
+    assert store.compact(keep_per_bean=0, max_age_days=0, settle=0) == 0
+    assert store.count_entries("alice", "b1") == 10
+
+
+def test_other_process_never_reads_moved_rows(make_store):
+    reader, compactor = make_store(), make_store()
+    reader.list_user_ids()  # snapshot fra før komprimeringen
+    compactor.compact(keep_per_bean=5, settle=0)
+
+    assert notes(reader.load_entries("alice", "b1")) == [f"alice{i}" for i in range(9, 4, -1)]
+    assert notes(reader.load_entries("bob", "b1")) == ["bob2", "bob1", "bob0"]
+    assert reader.compaction_epoch() == 1
+
+
+def test_cached_window_is_not_reused_across_epochs(make_store):
+    reader, compactor = make_store(), make_store()
+    reader.min_sync_interval = 3600  # kun læsningernes egen epoke-kontrol
+    assert notes(reader.load_entries("alice", "b1", limit=2)) == ["alice9", "alice8"]
+    compactor.compact(keep_per_bean=5, settle=0)
+    assert notes(reader.load_entries("alice", "b1", limit=2, offset=2)) == ["alice7", "alice6"]
+    assert notes(reader.load_user_data("bob")["b1"]["entries"]) == ["bob2", "bob1", "bob0"]
+
+
+def test_export_fails_instead_of_skipping_when_compacted_midway(make_store):
+    reader, compactor = make_store(), make_store()
+    reader.min_sync_interval = 3600
+    parts = reader.iter_entries("alice", "b1", chunk=3)
+    assert notes(next(parts)) == ["alice0", "alice1", "alice2"]
+    compactor.compact(keep_per_bean=2, settle=0)
+    with pytest.raises(RowsMoved):
+        list(parts)
+
+
+def test_appends_after_compaction_are_seen(sheet, make_store):
+    store = make_store()
+    store.compact(keep_per_bean=5, settle=0)
+    sheet._sheets["entries"].rows.append(entry_row("alice", "b1", "new"))
+    store.sync(force=True)
+    assert notes(store.load_entries("alice", "b1", limit=1)) == ["new"]
+    assert store.count_entries("alice", "b1") == 6
+
+
+def test_lease_held_by_other_process(sheet, make_store):
+    store = make_store()
+    store.list_user_ids()
+    until = datetime.datetime.now().timestamp() + 300
+    sheet._sheets["entries"].rows[0].append(f"compacting:0:other:{until:.0f}")
+    assert store.compact(keep_per_bean=1, settle=0) == 0
+    assert store.count_entries("alice", "b1") == 10
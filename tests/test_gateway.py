@@ -0,0 +1,44 @@
+import threading
+import time
+
+from gateway import GatedWorksheet, SheetsGateway
+
+
+class SlowWorksheet:
+    id = 1
+
+    def __init__(self):
+        self.calls = 0
+
+    def batch_get(self, ranges):
+        self.calls += 1
+        time.sleep(0.2)
+        return [[["x"]] for _ in ranges]
+
+
+def test_identical_batch_get_is_coalesced():
+    ws = SlowWorksheet()
+    gated = GatedWorksheet(ws, SheetsGateway(per_minute=6000, burst=100))
+    results = []
+
+    def read():
+        results.append(gated.batch_get(["A2:B3", "A5:B5"]))
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert ws.calls == 1
+    assert len(results) == 4 and all(r == results[0] for r in results)
+
+
+def test_different_ranges_are_not_coalesced():
+    ws = SlowWorksheet()
+    gated = GatedWorksheet(ws, SheetsGateway(per_minute=6000, burst=100))
+    threads = [threading.Thread(target=gated.batch_get, args=([r],)) for r in ("A1", "A2")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert ws.calls == 2
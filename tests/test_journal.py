@@ -0,0 +1,101 @@
+import pytest
+
+from conftest import notes
+from storage import Journal, JournalLocked, WriteBehindStorage
+
+
+def data(journal: Journal) -> list:
+    return [r["data"] for r in journal.replay()]
+
+
+def test_unacked_records_are_replayed_after_restart(tmp_path):
+    path = str(tmp_path / "j")
+    j = Journal(path)
+    j.append("entry", "u", "b", {"n": 1})
+    seq = j.append("entry", "u", "b", {"n": 2})
+    j.ack(seq - 1)
+    j.close()
+
+    j = Journal(path)
+    assert data(j) == [{"n": 2}]
+    assert j.append("entry", "u", "b", {"n": 3}) == seq + 1  # løbenumrene fortsætter
+    j.ack(seq + 1)
+    j.close()
+    assert data(Journal(path)) == []
+
+
+def test_restart_after_compaction_keeps_numbering(tmp_path):
+    path = str(tmp_path / "j")
+    j = Journal(path, compact_bytes=0)  # komprimér ved hvert fuldt ack
+    seq = j.append("entry", "u", "b", {"n": 1})
+    j.ack(seq)
+    j.close()
+    with open(path, encoding="utf-8") as fh:
+        assert fh.read().count("\n") == 1  # kun ack'en er tilbage
+
+    j = Journal(path)
+    assert j.append("entry", "u", "b", {"n": 2}) == seq + 1
+    j.close()  # stoppet før synk
+    assert data(Journal(path)) == [{"n": 2}]
+
+
+def test_half_written_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / "j")
+    j = Journal(path)
+    j.append("entry", "u", "b", {"n": 1})
+    j.close()
+    with open(path, "a", encoding="utf-8") as fh:
+        fh.write('{"seq": 2, "kind": "ent')
+    assert data(Journal(path)) == [{"n": 1}]
+
+
+def test_file_is_locked_while_open(tmp_path):
+    path = str(tmp_path / "j")
+    j = Journal(path)
+    with pytest.raises(JournalLocked):
+        Journal(path)
+    j.close()
+    Journal(path).close()
+
+
+def test_each_process_gets_its_own_file(tmp_path):
+    base = str(tmp_path / "j")
+    j1, j2 = Journal.for_process(base), Journal.for_process(base)
+    assert j1.path != j2.path
+
+    # Samme løbenummer i hver sin fil: ack i den ene rører ikke den anden
+    assert j1.append("entry", "u", "b", {"n": 1}) == j2.append("entry", "u", "b", {"n": 2}) == 1
+    j1.ack(1)
+    j1.close()
+    j2.close()
+
+    # Efter genstart med én proces overtages den andens ikke-synkede ændring
+    j = Journal.for_process(base)
+    assert data(j) == [{"n": 2}]
+    j.close()
+    j = Journal.for_process(base)
+    assert data(j) == [{"n": 2}]  # stadig ikke acket → stadig der, kun én gang
+    j.close()
+
+
+def test_old_shared_file_is_adopted(tmp_path):
+    base = str(tmp_path / "j")
+    old = Journal(base)
+    old.append("entry", "u", "b", {"n": 1})
+    old.close()
+    j = Journal.for_process(base)
+    assert j.path == base + ".0"
+    assert data(j) == [{"n": 1}]
+
+
+def test_write_behind_replays_and_acks(tmp_path, sheet, make_store):
+    path = str(tmp_path / "j")
+    journal = Journal(path)
+    journal.append("entry", "alice", "b1", {"Noter": "offline"})  # fra "sidste kørsel"
+    journal.close()
+
+    store = WriteBehindStorage(make_store(), flush_delay=0.0, journal=Journal(path))
+    assert store.flush(5)
+    assert notes(store.load_entries("alice", "b1", limit=1)) == ["offline"]
+    store.journal.close()
+    assert data(Journal(path)) == []
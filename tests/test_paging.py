@@ -0,0 +1,42 @@
+import pytest
+
+from conftest import notes
+from storage import ENTRIES_HEADER, SheetsStorage, SQLiteStorage, row_to_entry
+
+
+@pytest.fixture(params=["sqlite", "sheets", "sheets-incremental"])
+def store(request, sheet, make_store, tmp_path):
+    if request.param == "sheets":
+        return SheetsStorage(sheet._sheets["beans"], sheet._sheets["entries"])
+    if request.param == "sheets-incremental":
+        return make_store()
+    # Samme data i SQLite, i samme rækkefølge som i arket
+    store = SQLiteStorage(str(tmp_path / "kaffe.db"))
+    beans = {("alice", "b1"): {"brand": "R", "name": "b1", "process": "W", "target_ratio": 2},
+             ("bob", "b1"): {"brand": "R", "name": "b1", "process": "W", "target_ratio": 2}}
+    rows = sheet._sheets["entries"].get_all_values()[1:]
+    store.write_batch(beans, [(r[0], r[1], row_to_entry(dict(zip(ENTRIES_HEADER, r))))
+                              for r in rows])
+    return store
+
+
+def test_windows_are_newest_first(store):
+    assert notes(store.load_entries("alice", "b1", limit=3)) == ["alice9", "alice8", "alice7"]
+    assert notes(store.load_entries("alice", "b1", limit=3, offset=8)) == ["alice1", "alice0"]
+    assert store.load_entries("alice", "b1", limit=3, offset=10) == []
+    assert len(store.load_entries("alice", "b1")) == 10
+    assert store.count_entries("alice", "b1") == 10
+    assert store.count_entries("bob", "b1") == 3
+
+
+def test_consecutive_windows_cover_history_once(store):
+    seen = []
+    for offset in range(0, 10, 4):
+        seen += notes(store.load_entries("alice", "b1", limit=4, offset=offset))
+    assert seen == [f"alice{i}" for i in range(9, -1, -1)]
+
+
+def test_entries_limit_in_load_user_data(store):
+    assert notes(store.load_user_data("alice", entries_limit=2)["b1"]["entries"]) == ["alice9", "alice8"]
+    assert store.load_user_data("alice", entries_limit=0)["b1"]["entries"] == []
+    assert len(store.load_user_data("bob")["b1"]["entries"]) == 3
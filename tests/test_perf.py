@@ -0,0 +1,31 @@
+import contextvars
+import threading
+
+import perf
+from storage import parallel
+
+
+def test_pool_reads_are_recorded_in_the_session():
+    rec = perf.Recorder()
+
+    def session():
+        perf.bind_session(rec)
+        parallel(lambda: perf.record("sheets.get", 0.01), lambda: perf.record("sheets.get", 0.02))
+
+    t = threading.Thread(target=session)
+    t.start()
+    t.join()
+    assert [r["kald"] for r in rec.rows() if r["navn"] == "sheets.get"] == [2]
+
+
+def test_other_threads_do_not_see_the_session():
+    rec = perf.Recorder()
+
+    def session():
+        perf.bind_session(rec)
+        t = threading.Thread(target=perf.record, args=("baggrund", 0.01))
+        t.start()
+        t.join()
+
+    contextvars.copy_context().run(session)
+    assert not any(r["navn"] == "baggrund" for r in rec.rows())
@@ -0,0 +1,88 @@
+import pytest
+
+from conftest import entry_row, notes
+from storage import SharedCache
+
+
+@pytest.fixture
+def make_worker(make_store, tmp_path):
+    """En "serverproces" med sin egen forbindelse til samme cache-fil."""
+    path = str(tmp_path / "cache.sqlite")
+    return lambda **kw: make_store(shared=SharedCache(path, source="sheet"), **kw)
+
+
+def test_second_worker_starts_from_disk(sheet, make_worker):
+    first = make_worker()
+    assert notes(first.load_entries("alice", "b1", limit=2)) == ["alice9", "alice8"]
+    sheet.reset_counters()
+
+    second = make_worker()
+    assert notes(second.load_entries("alice", "b1", limit=2)) == ["alice9", "alice8"]
+    assert second.count_entries("bob", "b1") == 3
+    assert sum(sheet.calls.values()) == 0
+
+
+def test_write_in_one_worker_is_visible_in_another(sheet, make_worker):
+    a, b = make_worker(), make_worker()
+    b.list_user_ids()
+    a.append_entry("alice", "b1", {"Noter": "new"})
+    a.upsert_bean("alice", "b1", {"brand": "X", "name": "b1", "process": "W", "target_ratio": 2.2})
+    sheet.reset_counters()
+
+    assert b.count_entries("alice", "b1") == 11
+    assert b.load_user_data("alice", entries_limit=0)["b1"]["brand"] == "X"
+    assert sheet.calls.get("get", 0) == 0  # ingen halelæsning: det kom fra disken
+
+
+def test_only_one_worker_syncs_per_interval(sheet, make_worker):
+    workers = [make_worker(min_sync_interval=3600) for _ in range(3)]
+    for w in workers:
+        w.list_user_ids()
+    sheet._sheets["entries"].rows.append(entry_row("bob", "b1", "outside"))
+    sheet.reset_counters()
+    for w in workers:
+        assert w.count_entries("bob", "b1") == 3  # intervallet gælder alle
+    assert sum(sheet.calls.values()) == 0
+
+    workers[0].sync(force=True)
+    assert [w.count_entries("bob", "b1") for w in workers] == [4, 4, 4]
+    assert sheet.calls["batch_get"] == 1
+
+
+def test_compaction_starts_a_new_generation(sheet, make_worker):
+    a, b = make_worker(), make_worker()
+    b.load_entries("alice", "b1")
+    gen = b.shared.state()["gen"]
+
+    a.compact(keep_per_bean=5, settle=0)
+    assert a.shared.state()["gen"] != gen
+    assert notes(b.load_entries("alice", "b1")) == [f"alice{i}" for i in range(9, 4, -1)]
+    assert b.count_archived("alice", "b1") == 5
+    assert b.compaction_epoch() == 1
+
+
+def test_reload_interval_replaces_generation(make_worker):
+    a = make_worker(full_reload_every=0)
+    a.list_user_ids()
+    gen = a.shared.state()["gen"]
+    a.list_user_ids()
+    assert a.shared.state()["gen"] != gen
+
+
+def test_other_sheet_in_same_file_starts_over(tmp_path, make_store):
+    path = str(tmp_path / "cache.sqlite")
+    make_store(shared=SharedCache(path, source="sheet")).list_user_ids()
+    assert SharedCache(path, source="sheet").state().get("gen")
+    assert SharedCache(path, source="other").state().get("gen") is None
+
+
+def test_claim_without_due_work_takes_no_write_lock(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache, other = SharedCache(path), SharedCache(path)
+    assert cache.claim(False, 3600, 3600) == "reload"
+    cache.replace([], seen={"beans": 1, "entries": 1})
+    other._conn.execute("BEGIN IMMEDIATE")  # en anden proces holder skrivelåsen
+    try:
+        assert cache.claim(False, 3600, 3600) is None
+    finally:
+        other._conn.execute("ROLLBACK")
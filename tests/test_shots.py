@@ -0,0 +1,54 @@
+import pytest
+
+from shots import ShotStore
+from storage import ENTRY_FIELDS
+
+LABELS = dict(ENTRY_FIELDS)
+
+
+def shot(note: str, date: str = "2026-01-02", dose="18", grind="8") -> dict:
+    return {LABELS["date"]: date, LABELS["type"]: "Double", LABELS["grind"]: grind,
+            LABELS["dose"]: dose, LABELS["yield"]: "36", LABELS["time"]: "27,5",
+            LABELS["target_ratio"]: "2", LABELS["target_out"]: "36", LABELS["ratio"]: "2",
+            LABELS["advice"]: "", LABELS["notes"]: note}
+
+
+def test_round_trip_keeps_order_and_values():
+    entries = [shot("s2", "2026-01-03"), shot("s1", "2026-01-02", grind="2-3"), shot("s0", "")]
+    store = ShotStore.from_entries(entries)
+    rows = list(store.rows())
+    assert len(store) == 3
+    assert [r[LABELS["notes"]] for r in rows] == ["s2", "s1", "s0"]
+    assert rows[0] == dict(entries[0], **{LABELS["time"]: "27.5"})
+    assert rows[1][LABELS["grind"]] == "2-3"
+    assert rows[2][LABELS["date"]] == ""
+    assert list(rows[0]) == [label for _, label in ENTRY_FIELDS]
+
+
+def test_insert_newest_and_extend_older():
+    store = ShotStore.from_entries([shot("s1")])
+    store.insert_newest(shot("s2"))
+    store.extend_older([shot("s0")])
+    assert [r[LABELS["notes"]] for r in store.rows()] == ["s2", "s1", "s0"]
+    assert [r[LABELS["notes"]] for r in store.rows(limit=2)] == ["s2", "s1"]
+
+
+def test_values_are_copies_so_later_inserts_work():
+    store = ShotStore.from_entries([shot("s0", dose="18")])
+    dose = store.values("dose")
+    store.insert_newest(shot("s1", dose="19"))
+    assert list(dose) == [18.0]
+    assert list(store.values("dose")) == [19.0, 18.0]
+    assert list(store.values("grind")) == [8.0, 8.0]
+
+
+def test_failed_insert_leaves_columns_equal_length():
+    store = ShotStore.from_entries([shot("s0")])
+    view = memoryview(store.floats["dose"])  # låst buffer → BufferError midt i indsættelsen
+    with pytest.raises(BufferError):
+        store.insert_newest(shot("s1"))
+    view.release()
+    assert {len(store.days), len(store.grind_num), len(store.text["notes"]),
+            *(len(a) for a in store.floats.values())} == {1}
+    store.insert_newest(shot("s1"))
+    assert [r[LABELS["notes"]] for r in store.rows()] == ["s1", "s0"]
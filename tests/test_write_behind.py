@@ -0,0 +1,103 @@
+import threading
+
+from conftest import notes
+from storage import WriteBehindStorage
+
+
+class SlowInner:
+    """Pakker et lager ind, så `write_batch` kan holdes an efter skrivningen."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.written = threading.Event()
+        self.release = threading.Event()
+
+    def write_batch(self, beans, entries):
+        self.inner.write_batch(beans, entries)  # rækkerne er nu i arket
+        self.written.set()
+        self.release.wait(5)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+def test_read_during_in_flight_batch_shows_each_shot_once(make_store):
+    slow = SlowInner(make_store())
+    store = WriteBehindStorage(slow, flush_delay=0.0)
+    store.append_entry("alice", "b1", {"Noter": "new"})
+    assert slow.written.wait(5)
+
+    out = {}
+    reader = threading.Thread(target=lambda: out.update(
+        entries=store.load_entries("alice", "b1", limit=3),
+        count=store.count_entries("alice", "b1"),
+    ))
+    reader.start()
+    reader.join(0.2)
+    slow.release.set()
+    reader.join(5)
+    assert notes(out["entries"]) == ["new", "alice9", "alice8"]
+    assert out["count"] == 11
+
+
+class RecordingInner:
+    """Tæller batches; de første `fail` kald til `write_batch` fejler."""
+
+    def __init__(self, inner, fail: int = 0):
+        self.inner = inner
+        self.fail = fail
+        self.batches = []
+
+    def write_batch(self, beans, entries):
+        self.batches.append((dict(beans), list(entries)))
+        if len(self.batches) <= self.fail:
+            raise OSError("netværksfejl")
+        self.inner.write_batch(beans, entries)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+def test_writes_close_together_become_one_batch(make_store):
+    inner = RecordingInner(make_store())
+    store = WriteBehindStorage(inner, flush_delay=0.3)
+    store.upsert_bean("alice", "b2", {"brand": "R", "name": "første", "process": "W", "target_ratio": 2})
+    store.append_entry("alice", "b2", {"Noter": "s1"})
+    store.upsert_bean("alice", "b2", {"brand": "R", "name": "anden", "process": "W", "target_ratio": 2})
+    store.append_entry("alice", "b2", {"Noter": "s2"})
+    assert store.flush(5)
+
+    assert len(inner.batches) == 1
+    beans, entries = inner.batches[0]
+    assert beans == {("alice", "b2"): {"brand": "R", "name": "anden", "process": "W", "target_ratio": 2}}
+    assert [e["Noter"] for _, _, e in entries] == ["s1", "s2"]
+    data = store.load_user_data("alice")
+    assert data["b2"]["name"] == "anden"
+    assert notes(store.load_entries("alice", "b2")) == ["s2", "s1"]
+
+
+def test_failed_batch_is_requeued(make_store):
+    inner = RecordingInner(make_store(), fail=1)
+    store = WriteBehindStorage(inner, flush_delay=0.0)
+    store.append_entry("alice", "b1", {"Noter": "new"})
+    assert store.flush(5)
+
+    assert len(inner.batches) == 2
+    assert inner.batches[0] == inner.batches[1]
+    assert store.last_error is None and store.pending() == 0
+    assert notes(store.load_entries("alice", "b1", limit=2)) == ["new", "alice9"]
+    assert store.count_entries("alice", "b1") == 11
+
+
+def test_pending_shots_fill_the_window_first(make_store):
+    # Lang flush_delay → shots bliver liggende i køen under testen
+    store = WriteBehindStorage(make_store(), flush_delay=60)
+    store.append_entry("alice", "b1", {"Noter": "p0"})
+    store.append_entry("alice", "b1", {"Noter": "p1"})
+
+    assert notes(store.load_entries("alice", "b1", limit=3)) == ["p1", "p0", "alice9"]
+    assert notes(store.load_entries("alice", "b1", limit=3, offset=1)) == ["p0", "alice9", "alice8"]
+    assert notes(store.load_entries("alice", "b1", limit=2, offset=3)) == ["alice8", "alice7"]
+    assert notes(store.load_entries("alice", "b1", limit=2)) == ["p1", "p0"]
+    assert store.count_entries("alice", "b1") == 12
+    assert notes(store.load_entries("bob", "b1")) == ["bob2", "bob1", "bob0"]